@@ -0,0 +1,70 @@
+import json
+from typing import NotRequired, TypedDict
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Only the fields the crawler reads. With msgspec, responses are decoded straight from bytes into these shapes and
+# everything else (star player, event id, duration, player names, ...) is skipped without being allocated
+
+class Brawler(TypedDict):
+    name: str
+    power: int
+    trophies: int
+
+class Player(TypedDict):
+    tag: str
+    brawler: Brawler
+
+class Battle(TypedDict):
+    mode: str
+    type: str
+    result: NotRequired[str]
+    teams: NotRequired[list[list[Player]]]
+
+class Event(TypedDict):
+    map: NotRequired[str | None]
+
+class BattleLogEntry(TypedDict):
+    battleTime: str
+    event: Event
+    battle: Battle
+
+class BattleLog(TypedDict):
+    items: list[BattleLogEntry]
+
+class RankedPlayer(TypedDict):
+    tag: str
+    trophies: int
+
+class Rankings(TypedDict):
+    items: list[RankedPlayer]
+
+def decode_json(data: bytes):
+    # Generic decoding, with orjson when it's installed
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def schema_decoder(schema: type):
+    if msgspec is None:
+        return decode_json
+
+    decoder = msgspec.json.Decoder(schema)
+
+    def decode(data: bytes):
+        try:
+            return decoder.decode(data)
+        except msgspec.ValidationError:
+            # Payloads that don't match the schema (e.g. a mode with different fields) still decode in full
+            return decode_json(data)
+
+    return decode
+
+decode_battlelog = schema_decoder(BattleLog)
+decode_rankings = schema_decoder(Rankings)
@@ -0,0 +1,121 @@
+import hashlib
+import heapq
+import math
+import os
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Iterable
+
+def battle_key(battle_id: str) -> int:
+    # First 8 bytes of the md5 as a signed 64-bit integer, Postgres computes the same value with
+    # ('x' || substr(md5(battle_id), 1, 16))::bit(64)::bigint
+    return int.from_bytes(hashlib.md5(battle_id.encode()).digest()[:8], "big", signed=True)
+
+def battle_day(battle_id: str) -> str:
+    # Battle ids start with the battle time (YYYYMMDDTHHMMSS.000Z)
+    return battle_id[:8]
+
+class BloomFilter:
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key: int):
+        # Double hashing over the two 32-bit halves of the key
+        h1 = key & 0xFFFFFFFF
+        h2 = (key >> 32) & 0xFFFFFFFF | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: int):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+class DayShard:
+
+    def __init__(self, compact_threshold: int, bloom_capacity: int = 0):
+        # Recent keys go into a small set, which is periodically folded into a sorted 8-byte-per-key array
+        self.recent = set()
+        self.compacted = array("q")
+        self.compact_threshold = compact_threshold
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+
+    def __contains__(self, key: int) -> bool:
+        if self.bloom is not None and key not in self.bloom:
+            return False
+        if key in self.recent:
+            return True
+        i = bisect_left(self.compacted, key)
+        return i < len(self.compacted) and self.compacted[i] == key
+
+    def __len__(self) -> int:
+        return len(self.recent) + len(self.compacted)
+
+    def add(self, key: int):
+        self.recent.add(key)
+        if self.bloom is not None:
+            self.bloom.add(key)
+        if len(self.recent) >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        # Only the small recent set is sorted, then merged into the sorted array in one linear pass. Recent keys are
+        # never already compacted (add() is only called for new keys), so the merge needs no deduplication
+        if self.recent:
+            self.compacted = array("q", heapq.merge(self.compacted, sorted(self.recent)))
+            self.recent = set()
+
+class SeenBattleIndex:
+
+    def __init__(self, compact_threshold: int = 50_000, bloom_capacity: int = 0):
+        self.compact_threshold = compact_threshold
+        self.bloom_capacity = bloom_capacity
+        self.shards: dict[str, DayShard] = {}
+
+    def __contains__(self, battle_id: str) -> bool:
+        shard = self.shards.get(battle_day(battle_id))
+        return shard is not None and battle_key(battle_id) in shard
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards.values())
+
+    def has_key(self, day: str, key: int) -> bool:
+        # Same as `in`, for callers that already hashed the battle id
+        shard = self.shards.get(day)
+        return shard is not None and key in shard
+
+    def add(self, battle_id: str):
+        self.add_key(battle_day(battle_id), battle_key(battle_id))
+
+    def add_key(self, day: str, key: int):
+        if (shard := self.shards.get(day)) is None:
+            shard = self.shards[day] = DayShard(self.compact_threshold, self.bloom_capacity)
+        if key not in shard:
+            shard.add(key)
+
+    def update(self, battle_ids: Iterable[str]):
+        self.update_keys((battle_day(battle_id), battle_key(battle_id)) for battle_id in battle_ids)
+
+    def update_keys(self, keys: Iterable[tuple[str, int]]):
+        for day, key in keys:
+            self.add_key(day, key)
+        for shard in self.shards.values():
+            shard.compact()
+
+    def evict_before(self, cutoff_date: datetime) -> int:
+        cutoff_day = cutoff_date.strftime("%Y%m%d")
+        evicted = [day for day in self.shards if day < cutoff_day]
+        for day in evicted:
+            del self.shards[day]
+        return len(evicted)
+
+def create_battle_index() -> SeenBattleIndex:
+    return SeenBattleIndex(
+        compact_threshold=int(os.getenv('BATTLE_INDEX_COMPACT_THRESHOLD', 50_000)),
+        bloom_capacity=int(os.getenv('BATTLE_INDEX_BLOOM_CAPACITY', 0))
+    )
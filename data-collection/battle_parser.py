@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+from typing import NamedTuple
+from battle_index import SeenBattleIndex, battle_key
+
+EXCLUDED_MODES = frozenset(["soloShowdown", "duoShowdown", "duels", "bossFight"])
+
+# Battle results are stored from side 0's perspective
+RESULT_CODES = {"victory": 1, "draw": 0, "defeat": -1}
+
+class BattleRow(NamedTuple):
+    # Field order matches database.BATTLE_COLUMNS, so rows go straight into COPY
+    battle_id: int
+    battle_time: datetime
+    game_mode: str
+    game_map: str | None
+    game_type: str
+    result: int
+
+class ParticipantRow(NamedTuple):
+    # Field order matches database.PARTICIPANT_COLUMNS
+    battle_id: int
+    battle_time: datetime
+    player_id: str
+    side: bool
+    brawler: str
+    power: int
+    rank: int
+
+def parse_battle_time(value: str) -> datetime:
+    # Battle times always have the fixed layout YYYYMMDDTHHMMSS.000Z, so slicing beats strptime's format parsing
+    return datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[9:11]), int(value[11:13]), int(value[13:15]), tzinfo=timezone.utc)
+
+def crawl_priority(game_type: str, rank: int) -> int:
+    # Power League ranks (1-22) are scaled onto the trophy range so both can share one frontier
+    return rank * 50 if game_type == "soloRanked" else rank
+
+class BattleParser:
+
+    def __init__(self, cutoff_date: datetime, minimum_trophies: int = 0, minimum_power_league_rank: int = 0):
+        # Battle times compare correctly as strings, so the cutoff check needs no parsing
+        self.cutoff = cutoff_date.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.minimum_ranks = {"ranked": minimum_trophies, "soloRanked": minimum_power_league_rank}
+        # Battles looked up in the seen-battle index, and how many of them were already there
+        self.lookups = 0
+        self.duplicates = 0
+
+    def parse(self, player_id: str, battlelog: list, seen_battles: SeenBattleIndex) -> tuple[list[BattleRow], list[ParticipantRow], list[tuple[str, int]]]:
+        # Normalizes one battlelog into battle and participant rows for new battles, and the players they reference
+        battles, participants, new_players = [], [], []
+        lookups = duplicates = 0
+
+        for entry in battlelog:
+            battle = entry["battle"]
+            game_mode = battle["mode"]
+            if game_mode in EXCLUDED_MODES:
+                continue
+
+            game_type = battle["type"]
+            if game_type == "friendly":
+                continue
+
+            battle_time = entry["battleTime"]
+            if battle_time[:15] < self.cutoff:
+                continue
+
+            teams = battle.get("teams")
+            result = RESULT_CODES.get(battle.get("result"))
+            if result is None or teams is None or len(teams) != 2:
+                continue
+
+            team_0, team_1 = teams
+            tags_0 = [player["tag"] for player in team_0]
+            tags_1 = [player["tag"] for player in team_1]
+            min_0, min_1 = min(tags_0), min(tags_1)
+
+            # The id (battle time + lowest tag) is identical from every participant's battlelog
+            day, key = battle_time[:8], battle_key(battle_time + min(min_0, min_1))
+            lookups += 1
+            if seen_battles.has_key(day, key):
+                duplicates += 1
+                continue
+
+            # Keep battles where at least one player reaches the configured minimum
+            top_rank = max(player["brawler"]["trophies"] for team in teams for player in team)
+            if top_rank < self.minimum_ranks.get(game_type, 0):
+                continue
+
+            seen_battles.add_key(day, key)
+
+            # Side 0 is the team holding the lowest tag, the API reports the result for the player's own team
+            if player_id in tags_1:
+                result = -result
+            if min_1 < min_0:
+                team_0, team_1 = team_1, team_0
+                result = -result
+
+            battle_datetime = parse_battle_time(battle_time)
+            battles.append(BattleRow(key, battle_datetime, game_mode, entry["event"].get("map"), game_type, result))
+
+            for side, team in ((False, team_0), (True, team_1)):
+                for player in team:
+                    brawler = player["brawler"]
+                    participants.append(ParticipantRow(key, battle_datetime, player["tag"], side, brawler["name"], brawler["power"], brawler["trophies"]))
+                    new_players.append((player["tag"], crawl_priority(game_type, brawler["trophies"])))
+
+        self.lookups += lookups
+        self.duplicates += duplicates
+        return battles, participants, new_players
@@ -1,30 +1,89 @@
+import asyncio
 import os
+import time
 import aiohttp
+from api_schema import decode_battlelog, decode_json, decode_rankings
+from metrics import HTTP_LATENCY, HTTP_RESPONSES
+from rate_limiter import RateLimiter, parse_retry_after, backoff_delay
 
 if not (BRAWL_STARS_TOKEN := os.getenv("BRAWL_STARS_TOKEN")):
     raise ValueError("BRAWL_STARS_TOKEN is not set")
 
-async def get_top_players() -> list[dict]:
-    try:
-        url = "https://api.brawlstars.com/v1/rankings/global/players"
-        headers = {"Authorization": f"Bearer {BRAWL_STARS_TOKEN}"}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
-    except aiohttp.ClientError as e:
-        print(f"HTTP error occurred: {e}")
-        return []
-
-async def get_player_battlelog(player_id: str) -> list[dict]:
-    try:
+# Several tokens can be given comma-separated, each one gets its own rate budget
+BRAWL_STARS_TOKENS = [token.strip() for token in BRAWL_STARS_TOKEN.split(",") if token.strip()]
+
+# Overridable, e.g. to point the crawler at the local mock API of scripts.load_test
+BASE_URL = os.getenv("BRAWL_STARS_API_URL", "https://api.brawlstars.com/v1")
+
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+
+class BrawlStarsAPI:
+
+    def __init__(self, tokens: list[str] = BRAWL_STARS_TOKENS, rate: float | None = None):
+        # rate overrides the per-token rate limit, e.g. for processes sharing a token. A share can be below one
+        # request per second, the bucket still needs room for a whole request
+        rate = rate or float(os.getenv('BRAWL_STARS_RATE_LIMIT', 20))
+        self.tokens = tokens
+        self.session = None
+        self.rate_limiter = RateLimiter(
+            tokens,
+            rate=rate,
+            capacity=float(os.getenv('BRAWL_STARS_BURST', 0)) or max(1.0, rate)
+        )
+        self.max_retries = int(os.getenv('BRAWL_STARS_MAX_RETRIES', 5))
+        self.backoff_base = float(os.getenv('BRAWL_STARS_BACKOFF_BASE', 0.5))
+        self.backoff_cap = float(os.getenv('BRAWL_STARS_BACKOFF_CAP', 30))
+
+    @classmethod
+    async def create(cls, tokens: list[str] = BRAWL_STARS_TOKENS, rate: float | None = None):
+        self = cls(tokens, rate)
+        await self.create_session()
+        return self
+
+    async def create_session(self):
+        # One pooled session for the lifetime of the client, so connections (and their TLS handshakes) get reused
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv('BRAWL_STARS_MAX_CONNECTIONS', 100)),
+            limit_per_host=int(os.getenv('BRAWL_STARS_MAX_CONNECTIONS_PER_HOST', 20)),
+            ttl_dns_cache=int(os.getenv('BRAWL_STARS_DNS_CACHE_TTL', 300)),
+            keepalive_timeout=float(os.getenv('BRAWL_STARS_KEEPALIVE_TIMEOUT', 30))
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=float(os.getenv('BRAWL_STARS_REQUEST_TIMEOUT', 30)))
+        )
+
+    async def get(self, path: str, decode=decode_json, endpoint: str = "other") -> dict:
+        # Throttling and transient errors are retried with jittered backoff, anything else is raised to the caller.
+        # Bodies are read as bytes and handed to decode, so schema decoders can skip unused fields
+        for attempt in range(self.max_retries + 1):
+            bucket = await self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                async with self.session.get(f"{BASE_URL}{path}", headers={"Authorization": f"Bearer {bucket.token}"}) as response:
+                    # Time to the response headers, so every outcome is measured the same way
+                    HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+                    HTTP_RESPONSES.inc(endpoint=endpoint, status=response.status)
+                    if response.status in THROTTLE_STATUSES:
+                        bucket.throttle(parse_retry_after(response.headers.get("Retry-After")))
+                    if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        response.raise_for_status()
+                        bucket.recover()
+                        return decode(await response.read())
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                HTTP_RESPONSES.inc(endpoint=endpoint, status=0)
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+
+    async def get_top_players(self) -> dict:
+        return await self.get("/rankings/global/players", decode_rankings, "rankings")
+
+    async def get_player_battlelog(self, player_id: str) -> dict:
         player_id = player_id.replace("#", "%23")
-        url = f"https://api.brawlstars.com/v1/players/{player_id}/battlelog"
-        headers = {"Authorization": f"Bearer {BRAWL_STARS_TOKEN}"}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
-    except aiohttp.ClientError as e:
-        print(f"HTTP error occurred: {e}")
-        return []
+        return await self.get(f"/players/{player_id}/battlelog", decode_battlelog, "battlelog")
+
+    async def cleanup(self):
+        if self.session is not None:
+            await self.session.close()
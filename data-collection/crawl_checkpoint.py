@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from crawl_scheduler import CrawlScheduler
+from sharding import shard_of
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    # Last crawl, latest battle, battles per second and crawl priority per player, so revisits after a restart
+    # still follow each player's activity
+    """
+        CREATE TABLE IF NOT EXISTS crawl_player (
+            player_id TEXT PRIMARY KEY,
+            last_crawled TIMESTAMPTZ NOT NULL,
+            last_battle TIMESTAMPTZ
+        )
+    """,
+    "ALTER TABLE crawl_player ADD COLUMN IF NOT EXISTS battle_rate REAL",
+    "ALTER TABLE crawl_player ADD COLUMN IF NOT EXISTS priority REAL NOT NULL DEFAULT 0",
+    # The shard that saved the player and the process count at the time, so each shard loads only its own rows
+    # through the index. Rows saved under another process count (0 for rows from before the column) are reassigned
+    "ALTER TABLE crawl_player ADD COLUMN IF NOT EXISTS shard SMALLINT NOT NULL DEFAULT 0",
+    "ALTER TABLE crawl_player ADD COLUMN IF NOT EXISTS shards SMALLINT NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS crawl_player_shard ON crawl_player (shards, shard, last_crawled)",
+    # Pruning expired players is a range scan over this index instead of a scan of the whole table
+    "CREATE INDEX IF NOT EXISTS crawl_player_last_crawled ON crawl_player (last_crawled)",
+    # Players waiting in each shard's queue at the last checkpoint. Keyed by shard, so shards never write each other's rows
+    """
+        CREATE TABLE IF NOT EXISTS crawl_frontier (
+            shard SMALLINT NOT NULL,
+            player_id TEXT NOT NULL,
+            priority REAL NOT NULL,
+            PRIMARY KEY (shard, player_id)
+        )
+    """
+]
+
+PLAYER_COLUMNS = ['player_id', 'last_crawled', 'last_battle', 'battle_rate', 'priority', 'shard', 'shards']
+
+def to_datetime(timestamp: float | None) -> datetime | None:
+    return datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else None
+
+class CrawlCheckpoint:
+
+    def __init__(self, pool, shard: int = 0, shards: int = 1, interval: float = 60):
+        self.pool = pool
+        self.shard = shard
+        self.shards = shards
+        self.interval = interval
+
+    async def initialize(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('crawl_checkpoint'))")
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+
+    async def load(self, scheduler: CrawlScheduler, chunk_size: int = 50_000) -> tuple[int, int]:
+        # Restores this shard's players crawled within the longest revisit delay (older ones are due anyway)
+        # and the frontier it had queued, which the scheduler picks up ahead of the top players
+        players = 0
+        since = to_datetime(time.time() - scheduler.max_revisit)
+        columns = "player_id, last_crawled, last_battle, battle_rate, priority"
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                # This shard's own rows, then any saved under another process count, which are filtered by owner
+                for query, args, reassigned in [
+                    (f"SELECT {columns} FROM crawl_player WHERE shards = $2 AND shard = $3 AND last_crawled >= $1", (self.shards, self.shard), False),
+                    (f"SELECT {columns} FROM crawl_player WHERE (shards < $2 OR shards > $2) AND last_crawled >= $1", (self.shards,), True)
+                ]:
+                    cursor = await conn.cursor(query, since, *args, prefetch=chunk_size)
+                    while rows := await cursor.fetch(chunk_size):
+                        for row in rows:
+                            if reassigned and shard_of(row['player_id'], self.shards) != self.shard:
+                                continue
+                            scheduler.restore(
+                                row['player_id'], row['last_crawled'].timestamp(), row['last_battle'] and row['last_battle'].timestamp(),
+                                row['battle_rate'], row['priority']
+                            )
+                            players += 1
+                            if reassigned:
+                                # Saved again under this shard at the next checkpoint
+                                scheduler.dirty.add(row['player_id'])
+            # Frontier rows are filtered by owner rather than by their shard column, so a changed process count still resumes
+            frontier = [
+                (row['player_id'], row['priority'])
+                for row in await conn.fetch("SELECT player_id, priority FROM crawl_frontier ORDER BY priority DESC")
+                if shard_of(row['player_id'], self.shards) == self.shard
+            ]
+        frontier = frontier[:scheduler.max_frontier]
+        scheduler.leftover.extend(frontier)
+        return players, len(frontier)
+
+    async def save(self, scheduler: CrawlScheduler):
+        dirty, scheduler.dirty = scheduler.dirty, set()
+        players = [
+            (
+                player_id, to_datetime(scheduler.last_crawled[player_id]), to_datetime(scheduler.last_battle.get(player_id)),
+                scheduler.battle_rate.get(player_id), scheduler.priority.get(player_id, 0), self.shard, self.shards
+            )
+            for player_id in dirty if player_id in scheduler.last_crawled
+        ]
+        frontier = [(player_id, self.shard, priority) for player_id, priority in scheduler.frontier()]
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("""
+                        CREATE TEMPORARY TABLE IF NOT EXISTS crawl_player_staging (LIKE crawl_player) ON COMMIT DELETE ROWS
+                    """)
+                    await conn.copy_records_to_table('crawl_player_staging', records=players, columns=PLAYER_COLUMNS)
+                    await conn.execute("""
+                        INSERT INTO crawl_player (player_id, last_crawled, last_battle, battle_rate, priority, shard, shards)
+                        SELECT player_id, last_crawled, last_battle, battle_rate, priority, shard, shards FROM crawl_player_staging
+                        ON CONFLICT (player_id) DO UPDATE SET
+                            last_crawled = GREATEST(crawl_player.last_crawled, EXCLUDED.last_crawled),
+                            last_battle = GREATEST(crawl_player.last_battle, EXCLUDED.last_battle),
+                            battle_rate = COALESCE(EXCLUDED.battle_rate, crawl_player.battle_rate),
+                            priority = EXCLUDED.priority,
+                            shard = EXCLUDED.shard,
+                            shards = EXCLUDED.shards
+                    """)
+                    # Each shard replaces its own frontier, shard 0 also clears rows left by a larger process count
+                    await conn.execute("DELETE FROM crawl_frontier WHERE shard = $1 OR ($1 = 0 AND shard >= $2)", self.shard, self.shards)
+                    await conn.copy_records_to_table('crawl_frontier', records=frontier, columns=['player_id', 'shard', 'priority'])
+                    # Expired players are due anyway, one shard prunes them for all
+                    if self.shard == 0:
+                        await conn.execute("DELETE FROM crawl_player WHERE last_crawled < $1", to_datetime(time.time() - scheduler.max_revisit))
+        except Exception as e:
+            # The players stay dirty, so the next checkpoint writes them again
+            scheduler.dirty |= dirty
+            logger.error(f"Error saving crawl checkpoint: {str(e)}")
+            return
+        scheduler.forget_due()
+        logger.info(f"Checkpointed {len(players):,} players and a frontier of {len(frontier):,}")
+
+    async def save_periodically(self, scheduler: CrawlScheduler):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save(scheduler)
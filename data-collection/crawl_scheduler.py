@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Iterable
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Handler processes one player and returns the (player_id, priority) pairs it discovered
+Handler = Callable[[str], Awaitable[Iterable[tuple[str, float]]]]
+
+STOP = float("-inf")
+
+class CrawlScheduler:
+
+    def __init__(self, workers: int = 20, max_frontier: int = 200_000, players_per_loop: int = 500_000, min_revisit: float = 600, max_revisit: float = 86_400,
+                 revisit_battles: float = 20, request_budget: float = 0):
+        self.workers = workers
+        self.max_frontier = max_frontier
+        self.players_per_loop = players_per_loop
+        self.min_revisit = min_revisit
+        self.max_revisit = max_revisit
+        # Battles a player should have played by their next visit, below the 25 a battlelog holds so none are lost
+        self.revisit_battles = revisit_battles
+        # Players crawled per second across all workers, 0 leaves it to the API rate limit. A shard's share of the
+        # budget can be below one player per second, the bucket still holds one whole player
+        self.budget = TokenBucket("budget", request_budget, max(1.0, request_budget), request_budget) if request_budget else None
+        # Unbounded so stop markers always fit, the frontier cap is enforced in add()
+        self.queue = asyncio.PriorityQueue()
+        self.counter = itertools.count()
+        # Players waiting in (or being processed from) the queue, with their priority
+        self.queued: dict[str, float] = {}
+        # Unix times of each player's last crawl and latest battle, their estimated battles per second and crawl
+        # priority. Players are dropped once they're due anyway
+        self.last_crawled: dict[str, float] = {}
+        self.last_battle: dict[str, float] = {}
+        self.battle_rate: dict[str, float] = {}
+        self.priority: dict[str, float] = {}
+        # (due time, player_id) heap of planned revisits, and each player's live due time. Entries replaced by a later
+        # crawl are stale, skipped when popped and dropped whenever they outnumber the live ones
+        self.revisits = []
+        self.planned: dict[str, float] = {}
+        # Players whose times changed since the last checkpoint
+        self.dirty = set()
+        self.leftover = []
+        self.processed = 0
+        self.busy = 0
+        self.loop_done = asyncio.Event()
+
+    def revisit_delay(self, player_id: str) -> float:
+        # Time for the player to play revisit_battles new battles at their estimated rate, so each visit finds about
+        # that many new battles: active players come back before their battlelog overflows, idle ones rarely
+        rate = self.battle_rate.get(player_id)
+        delay = self.revisit_battles / rate if rate else self.max_revisit
+        return min(self.max_revisit, max(self.min_revisit, delay))
+
+    def due(self, player_id: str, now: float | None = None) -> bool:
+        if player_id not in self.last_crawled:
+            return True
+        return (now or time.time()) >= self.last_crawled[player_id] + self.revisit_delay(player_id)
+
+    def add(self, player_id: str, priority: float = 0) -> bool:
+        if player_id in self.queued or self.queue.qsize() >= self.max_frontier or not self.due(player_id):
+            return False
+        # Highest priority first, ties in discovery order
+        self.queue.put_nowait((-priority, next(self.counter), player_id))
+        self.queued[player_id] = priority
+        return True
+
+    def record_battles(self, player_id: str, battle_times: list[float]):
+        # Called by the handler with the times of every battle in the player's battlelog
+        if not battle_times:
+            return
+        if (latest := max(battle_times)) > self.last_battle.get(player_id, 0):
+            self.last_battle[player_id] = latest
+        # Battles per second from the oldest logged battle up to now, so the estimate decays while a player is idle,
+        # averaged with the previous estimate to smooth out bursts
+        rate = len(battle_times) / max(time.time() - min(battle_times), 1)
+        previous = self.battle_rate.get(player_id)
+        self.battle_rate[player_id] = rate if previous is None else (previous + rate) / 2
+        self.dirty.add(player_id)
+
+    def schedule_revisit(self, player_id: str):
+        due = self.planned[player_id] = self.last_crawled[player_id] + self.revisit_delay(player_id)
+        heapq.heappush(self.revisits, (due, player_id))
+        if len(self.revisits) > 2 * len(self.planned):
+            self.revisits = [(due, player_id) for player_id, due in self.planned.items()]
+            heapq.heapify(self.revisits)
+
+    def restore(self, player_id: str, last_crawled: float, last_battle: float | None, battle_rate: float | None, priority: float):
+        self.last_crawled[player_id] = last_crawled
+        if last_battle is not None:
+            self.last_battle[player_id] = last_battle
+        if battle_rate is not None:
+            self.battle_rate[player_id] = battle_rate
+        self.priority[player_id] = priority
+        self.schedule_revisit(player_id)
+
+    def frontier(self) -> list[tuple[str, float]]:
+        # Queued and in-flight players plus those carried over between loops
+        return [*self.queued.items(), *self.leftover]
+
+    def forget_due(self) -> int:
+        # Players past their revisit delay are due whether or not they're remembered, so their times can go
+        now = time.time()
+        forgotten = [player_id for player_id in self.last_crawled if self.due(player_id, now) and player_id not in self.dirty]
+        for player_id in forgotten:
+            del self.last_crawled[player_id]
+            self.last_battle.pop(player_id, None)
+            self.battle_rate.pop(player_id, None)
+            self.priority.pop(player_id, None)
+        return len(forgotten)
+
+    def release_due(self) -> float:
+        # Moves due revisits into the frontier, leaving them planned while the frontier is full. Returns the seconds
+        # until the next revisit is due
+        now = time.time()
+        while self.revisits and self.revisits[0][0] <= now and self.queue.qsize() < self.max_frontier:
+            due, player_id = heapq.heappop(self.revisits)
+            if self.planned.get(player_id) != due:
+                continue
+            del self.planned[player_id]
+            self.add(player_id, self.priority.get(player_id, 0))
+        return self.revisits[0][0] - now if self.revisits else float("inf")
+
+    async def release_revisits(self):
+        while True:
+            await asyncio.sleep(min(max(self.release_due(), 0), 1))
+
+    async def worker(self, handler: Handler):
+        while True:
+            priority, _, player_id = await self.queue.get()
+            try:
+                if priority == STOP:
+                    return
+                if self.budget is not None:
+                    await self.budget.acquire()
+                self.busy += 1
+                try:
+                    for new_player_id, new_priority in await handler(player_id):
+                        self.add(new_player_id, new_priority)
+                except Exception as e:
+                    logger.error(f"Error processing player {player_id}: {str(e)}")
+                finally:
+                    self.busy -= 1
+                    self.last_crawled[player_id] = time.time()
+                    self.priority[player_id] = self.queued.pop(player_id, -priority)
+                    self.dirty.add(player_id)
+                    self.schedule_revisit(player_id)
+                self.processed += 1
+                if self.processed >= self.players_per_loop:
+                    self.loop_done.set()
+            finally:
+                self.queue.task_done()
+
+    async def run(self, handler: Handler, seeds: Iterable[tuple[str, float]]):
+        # Players still queued from the previous loop carry over, the rest are revisited once they're due
+        self.processed = 0
+        self.loop_done.clear()
+
+        leftover, self.leftover = self.leftover, []
+        for player_id, priority in itertools.chain(leftover, seeds):
+            self.add(player_id, priority)
+        self.release_due()
+
+        workers = [asyncio.create_task(self.worker(handler)) for _ in range(self.workers)]
+        revisits = asyncio.create_task(self.release_revisits())
+        frontier_exhausted = asyncio.create_task(self.queue.join())
+        limit_reached = asyncio.create_task(self.loop_done.wait())
+
+        try:
+            await asyncio.wait([frontier_exhausted, limit_reached, *workers], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Stop markers sort ahead of every player, so workers finish their in-flight player and exit
+            for _ in workers:
+                self.queue.put_nowait((STOP, next(self.counter), None))
+            await asyncio.gather(*workers, return_exceptions=True)
+            revisits.cancel()
+            frontier_exhausted.cancel()
+            limit_reached.cancel()
+
+            while not self.queue.empty():
+                priority, _, player_id = self.queue.get_nowait()
+                self.queue.task_done()
+                if priority != STOP:
+                    self.queued.pop(player_id, None)
+                    self.leftover.append((player_id, -priority))
@@ -1,17 +1,296 @@
+import asyncio
 import asyncpg
+import logging
 import os
-from typing import List, Dict
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable, List, Tuple
+from metrics import FLUSH_ERRORS, FLUSH_LATENCY, FLUSH_SIZE, FLUSHED_ROWS
+
+logger = logging.getLogger(__name__)
+
+# Small lookup tables, so battle rows store 2-byte codes instead of repeating names
+DICTIONARY_TABLES = ['game_mode', 'game_map', 'game_type', 'brawler']
+
+SCHEMA = [
+    *(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """ for table in DICTIONARY_TABLES),
+    # One row per battle. battle_id is battle_key() of the battle time + lowest player tag, and
+    # result is from side 0's perspective (1 victory, 0 draw, -1 defeat)
+    """
+        CREATE TABLE IF NOT EXISTS battle (
+            battle_id BIGINT NOT NULL,
+            battle_time TIMESTAMPTZ NOT NULL,
+            mode_id SMALLINT NOT NULL,
+            map_id SMALLINT,
+            type_id SMALLINT NOT NULL,
+            result SMALLINT NOT NULL,
+            PRIMARY KEY (battle_id, battle_time)
+        ) PARTITION BY RANGE (battle_time)
+    """,
+    # One row per player in a battle. Side 0 (false) is the team holding the lowest player tag.
+    # battle_time is repeated so participants are partitioned (and dropped) together with their battle
+    """
+        CREATE TABLE IF NOT EXISTS battle_participant (
+            battle_id BIGINT NOT NULL,
+            battle_time TIMESTAMPTZ NOT NULL,
+            player_id TEXT NOT NULL,
+            side BOOLEAN NOT NULL,
+            brawler_id SMALLINT NOT NULL,
+            power SMALLINT NOT NULL,
+            rank SMALLINT NOT NULL,
+            PRIMARY KEY (battle_id, player_id, battle_time)
+        ) PARTITION BY RANGE (battle_time)
+    """,
+    # Games and victories per exact rank, kept up to date on every flush. Bucketed stats ("rank >= bucket")
+    # are suffix sums over these small tables instead of scans over every participant. map_id 0 is an unknown map
+    """
+        CREATE TABLE IF NOT EXISTS brawler_rollup (
+            type_id SMALLINT NOT NULL,
+            mode_id SMALLINT NOT NULL,
+            map_id SMALLINT NOT NULL,
+            rank SMALLINT NOT NULL,
+            brawler_id SMALLINT NOT NULL,
+            games BIGINT NOT NULL,
+            victories BIGINT NOT NULL,
+            PRIMARY KEY (type_id, mode_id, map_id, rank, brawler_id)
+        )
+    """,
+    # team holds the side's brawler ids sorted ascending, rank is the rank of the participant counted
+    """
+        CREATE TABLE IF NOT EXISTS team_rollup (
+            type_id SMALLINT NOT NULL,
+            mode_id SMALLINT NOT NULL,
+            map_id SMALLINT NOT NULL,
+            rank SMALLINT NOT NULL,
+            team SMALLINT[] NOT NULL,
+            games BIGINT NOT NULL,
+            victories BIGINT NOT NULL,
+            PRIMARY KEY (type_id, mode_id, map_id, rank, team)
+        )
+    """,
+    # Battles per UTC day, type and mode, kept up to date on every flush so counts never scan the battle tables
+    """
+        CREATE TABLE IF NOT EXISTS battle_daily_stats (
+            day DATE NOT NULL,
+            type_id SMALLINT NOT NULL,
+            mode_id SMALLINT NOT NULL,
+            battles BIGINT NOT NULL,
+            PRIMARY KEY (day, type_id, mode_id)
+        )
+    """
+]
+
+# Created on the partitioned parents, so every partition (including future ones) gets them. BRIN on battle_time stays
+# tiny because rows arrive roughly in time order, and the composite index serves filters on type, mode and map
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS battle_time_brin ON battle USING brin (battle_time)",
+    "CREATE INDEX IF NOT EXISTS battle_participant_time_brin ON battle_participant USING brin (battle_time)",
+    "CREATE INDEX IF NOT EXISTS battle_type_mode_map ON battle (type_id, mode_id, map_id)"
+]
+
+ROLLUP_TABLES = ['brawler_rollup', 'team_rollup', 'battle_daily_stats']
+
+# Adds the battles selected by the given CTE (battle_time, type_id, mode_id) to the daily stats
+DAILY_STATS_STATEMENT = """
+    {battles}
+    INSERT INTO battle_daily_stats (day, type_id, mode_id, battles)
+    SELECT (battle_time AT TIME ZONE 'UTC')::date, type_id, mode_id, COUNT(*)
+    FROM battles
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, type_id, mode_id) DO UPDATE SET
+        battles = battle_daily_stats.battles + EXCLUDED.battles
+"""
+
+PARTITIONED_TABLES = ['battle', 'battle_participant']
+PARTITION_INTERVAL = os.getenv('BATTLE_PARTITION_INTERVAL', 'day')
+
+BATTLE_COLUMNS = ['battle_id', 'battle_time', 'game_mode', 'game_map', 'game_type', 'result']
+PARTICIPANT_COLUMNS = ['battle_id', 'battle_time', 'player_id', 'side', 'brawler', 'power', 'rank']
+
+def partition_range(day: date) -> Tuple[date, date]:
+    # Daily partitions by default, BATTLE_PARTITION_INTERVAL=week groups them Monday to Sunday
+    if PARTITION_INTERVAL == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    return day, day + timedelta(days=1)
+
+def rollup_statement(participants: str, battles: str = 'battle', sign: int = 1) -> str:
+    # Adds the participants selected by the given CTE (battle_id, battle_time, side, brawler_id, rank) to both rollups,
+    # or subtracts them with sign -1. battles is the table their battle rows are read from
+    return f"""
+        {participants},
+        participant_results AS (
+            SELECT
+                p.battle_id,
+                p.side,
+                p.brawler_id,
+                p.rank,
+                b.type_id,
+                b.mode_id,
+                COALESCE(b.map_id, 0) AS map_id,
+                b.result = CASE WHEN p.side THEN -1 ELSE 1 END AS victory
+            FROM participants p
+            JOIN {battles} b ON b.battle_id = p.battle_id AND b.battle_time = p.battle_time
+        ),
+        teams AS (
+            SELECT battle_id, side, array_agg(brawler_id ORDER BY brawler_id) AS team
+            FROM participants
+            GROUP BY battle_id, side
+        ),
+        brawler_rollup_update AS (
+            INSERT INTO brawler_rollup (type_id, mode_id, map_id, rank, brawler_id, games, victories)
+            SELECT type_id, mode_id, map_id, rank, brawler_id, {sign} * COUNT(*), {sign} * COUNT(*) FILTER (WHERE victory)
+            FROM participant_results
+            GROUP BY type_id, mode_id, map_id, rank, brawler_id
+            ORDER BY type_id, mode_id, map_id, rank, brawler_id
+            ON CONFLICT (type_id, mode_id, map_id, rank, brawler_id) DO UPDATE SET
+                games = brawler_rollup.games + EXCLUDED.games,
+                victories = brawler_rollup.victories + EXCLUDED.victories
+        )
+        INSERT INTO team_rollup (type_id, mode_id, map_id, rank, team, games, victories)
+        SELECT p.type_id, p.mode_id, p.map_id, p.rank, t.team, {sign} * COUNT(*), {sign} * COUNT(*) FILTER (WHERE p.victory)
+        FROM participant_results p
+        JOIN teams t ON t.battle_id = p.battle_id AND t.side = p.side
+        GROUP BY p.type_id, p.mode_id, p.map_id, p.rank, t.team
+        ORDER BY p.type_id, p.mode_id, p.map_id, p.rank, t.team
+        ON CONFLICT (type_id, mode_id, map_id, rank, team) DO UPDATE SET
+            games = team_rollup.games + EXCLUDED.games,
+            victories = team_rollup.victories + EXCLUDED.victories
+    """
+
+async def rebuild_rollups(conn):
+    # Full recompute, for migrations and repairs only (retention subtracts what it removes). The lock makes concurrent
+    # flushes wait, so their increments land on top of the rebuilt totals instead of being counted twice
+    async with conn.transaction():
+        await conn.execute(f"LOCK TABLE {', '.join(ROLLUP_TABLES)} IN EXCLUSIVE MODE")
+        await conn.execute(f"TRUNCATE {', '.join(ROLLUP_TABLES)}")
+        await conn.execute(rollup_statement("""
+            WITH participants AS (
+                SELECT battle_id, battle_time, side, brawler_id, rank FROM battle_participant
+            )
+        """))
+        await conn.execute(DAILY_STATS_STATEMENT.format(battles="""
+            WITH battles AS (
+                SELECT battle_time, type_id, mode_id FROM battle
+            )
+        """))
+
+async def create_partitions(conn, days: Iterable[date]) -> set:
+    starts = set()
+    # Concurrent crawler processes may create the same partition, which IF NOT EXISTS alone doesn't make safe
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('battle_partitions'))")
+        for start, end in {partition_range(day) for day in days}:
+            for table in PARTITIONED_TABLES:
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table}_p{start:%Y%m%d} PARTITION OF {table}
+                    FOR VALUES FROM ('{start} 00:00:00+00') TO ('{end} 00:00:00+00')
+                """)
+            starts.add(start)
+    return starts
+
+async def list_partitions(conn, table: str) -> List[Tuple[str, datetime, datetime]]:
+    rows = await conn.fetch("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+    """, table)
+    partitions = []
+    for row in rows:
+        if match := re.search(r"FROM \('([^']+)'\) TO \('([^']+)'\)", row['bound']):
+            start, end = (datetime.fromisoformat(value).astimezone(timezone.utc) for value in match.groups())
+            partitions.append((row['relname'], start, end))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+async def subtract_from_rollups(conn, battles: str, participants: str, start: datetime, end: datetime):
+    # Takes the battles in [start, end) of the given tables back out of the rollups and daily stats, so retention
+    # keeps them exact without a full rebuild. Row locks only, concurrent flushes keep adding on top. Retention
+    # cutoffs are whole UTC days, so the daily stats rows of the range are simply deleted
+    await conn.execute(rollup_statement(f"""
+        WITH participants AS (
+            SELECT battle_id, battle_time, side, brawler_id, rank FROM {participants}
+            WHERE battle_time >= $1 AND battle_time < $2
+        )
+    """, battles=battles, sign=-1), start, end)
+    await conn.execute("DELETE FROM battle_daily_stats WHERE day >= $1 AND day < $2", start.date(), end.date())
+    for table in ['brawler_rollup', 'team_rollup']:
+        await conn.execute(f"DELETE FROM {table} WHERE games <= 0")
+
+async def drop_partitions_before(conn, cutoff_date: datetime) -> List[str]:
+    # Whole partitions below the cutoff are detached and dropped, a metadata operation instead of a row DELETE.
+    # Their battles are subtracted from the rollups in the transaction that drops them, so an interrupted run never
+    # subtracts twice. Partitions left detached by an interrupted run are picked up again
+    partitions = {}
+    for table in PARTITIONED_TABLES:
+        for name, start, end in await list_partitions(conn, table):
+            if end <= cutoff_date:
+                await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name} CONCURRENTLY")
+                partitions.setdefault((start, end), {})[table] = name
+    for name, start, end in await list_detached_partitions(conn):
+        partitions.setdefault((start, end), {}).update({table: name for table in PARTITIONED_TABLES if name == f"{table}_p{start:%Y%m%d}"})
+
+    dropped = []
+    for (start, end), names in sorted(partitions.items()):
+        async with conn.transaction():
+            if len(names) == len(PARTITIONED_TABLES):
+                await subtract_from_rollups(conn, names['battle'], names['battle_participant'], start, end)
+            for name in names.values():
+                await conn.execute(f"DROP TABLE {name}")
+                dropped.append(name)
+    return dropped
+
+async def list_detached_partitions(conn) -> List[Tuple[str, datetime, datetime]]:
+    # Tables named like partitions that are no longer attached, the range follows from the name and the interval
+    rows = await conn.fetch("""
+        SELECT relname FROM pg_class
+        WHERE relkind = 'r' AND NOT relispartition AND relname ~ '^battle(_participant)?_p[0-9]{8}$'
+    """)
+    partitions = []
+    for row in rows:
+        start, end = partition_range(datetime.strptime(row['relname'][-8:], '%Y%m%d').date())
+        partitions.append((row['relname'], *(datetime.combine(day, datetime.min.time(), timezone.utc) for day in (start, end))))
+    return partitions
+
+async def delete_battles_between(conn, start: datetime, end: datetime):
+    # Row DELETE for a partition straddling the retention cutoff, with its battles subtracted from the rollups first
+    async with conn.transaction():
+        await subtract_from_rollups(conn, 'battle', 'battle_participant', start, end)
+        for table in PARTITIONED_TABLES:
+            await conn.execute(f"DELETE FROM {table} WHERE battle_time >= $1 AND battle_time < $2", start, end)
 
 class Database:
-    
-    def __init__(self):
+
+    def __init__(self, staging_suffix: str = 'staging'):
         self.pool = None
+        # Write-behind buffer shared by all workers, flushed by size or time
+        self.battle_staging = f'battle_{staging_suffix}'
+        self.participant_staging = f'battle_participant_{staging_suffix}'
+        self.pending_battles = []
+        self.pending_participants = []
+        self.flush_rows = int(os.getenv('DB_FLUSH_ROWS', 5000))
+        self.flush_interval = float(os.getenv('DB_FLUSH_INTERVAL', 2))
+        self.max_pending_rows = int(os.getenv('DB_MAX_PENDING_ROWS', 50_000))
+        self.flush_lock = asyncio.Lock()
+        self.flush_requested = asyncio.Event()
+        self.flush_task = None
+        self.closing = False
+        self.partitions = set()
+        self.queued_battles = 0
 
     @classmethod
-    async def create(cls):
-        self = cls()
+    async def create(cls, staging_suffix: str = 'staging'):
+        self = cls(staging_suffix)
         await self.create_pool()
         await self.initialize_table()
+        self.flush_task = asyncio.create_task(self.flush_periodically())
         return self
 
     async def create_pool(self):
@@ -27,61 +306,161 @@ class Database:
 
     async def initialize_table(self):
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS battles (
-                    battle_id TEXT,
-                    battle_time TEXT,
+            async with conn.transaction():
+                # Serialized, so crawler processes starting together don't race on the catalog
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('battle_schema'))")
+                stats_existed = await conn.fetchval("SELECT to_regclass('battle_daily_stats') IS NOT NULL")
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+                # Databases from before the daily stats get them backfilled once
+                if not stats_existed:
+                    await conn.execute(DAILY_STATS_STATEMENT.format(battles="""
+                        WITH battles AS (
+                            SELECT battle_time, type_id, mode_id FROM battle
+                        )
+                    """))
+                # Only slow the first time, on a database created before the indexes existed
+                for statement in INDEXES:
+                    await conn.execute(statement)
+            # Partitions for the next days are created ahead of time, older ones on demand when a flush needs them
+            today = datetime.now(timezone.utc).date()
+            self.partitions |= await create_partitions(conn, (today + timedelta(days=i) for i in range(-1, int(os.getenv('BATTLE_PARTITIONS_AHEAD', 7)) + 1)))
+            # Unlogged and constraint-free, so COPY into them is cheap. Names stay as text here and are
+            # encoded into dictionary codes when merged on flush
+            await conn.execute(f"""
+                CREATE UNLOGGED TABLE IF NOT EXISTS {self.battle_staging} (
+                    battle_id BIGINT,
+                    battle_time TIMESTAMPTZ,
                     game_mode TEXT,
                     game_map TEXT,
                     game_type TEXT,
-                    brawler TEXT,
-                    power INTEGER,
-                    rank INTEGER,
-                    result TEXT,
-                    team TEXT,
-                    team_power TEXT,
-                    team_rank TEXT,
-                    opponents TEXT,
-                    opponents_power TEXT,
-                    opponents_rank TEXT,
+                    result SMALLINT
+                )
+            """)
+            await conn.execute(f"""
+                CREATE UNLOGGED TABLE IF NOT EXISTS {self.participant_staging} (
+                    battle_id BIGINT,
+                    battle_time TIMESTAMPTZ,
                     player_id TEXT,
-                    team_ids TEXT,
-                    opponents_ids TEXT,
-                    PRIMARY KEY (battle_id, player_id)
+                    side BOOLEAN,
+                    brawler TEXT,
+                    power SMALLINT,
+                    rank SMALLINT
                 )
             """)
 
-    async def get_unique_battle_ids(self) -> List[str]:
-        async with self.pool.acquire() as conn:
-            unique_battle_ids = await conn.fetch("SELECT DISTINCT battle_id FROM battles")
-            return [row['battle_id'] for row in unique_battle_ids]
-
-    async def insert_battles(self, battles: List[Dict]):
-        async with self.pool.acquire() as conn:
-            await conn.executemany("""
-                INSERT INTO battles 
-                (battle_id, battle_time, game_mode, game_map, game_type, brawler, power, rank, result,
-                 team, team_power, team_rank, opponents, opponents_power, opponents_rank, player_id, team_ids, opponents_ids)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18)
-                ON CONFLICT (battle_id, player_id) DO NOTHING
-            """, [
-                (b['battle_id'], b['battle_time'], b['game_mode'], b['game_map'],
-                 b['game_type'], b['brawler'], b['power'], b['rank'], b['result'],
-                 b['team'], b['team_power'], b['team_rank'], b['opponents'],
-                 b['opponents_power'], b['opponents_rank'], b['player_id'], b['team_ids'], b['opponents_ids'])
-                for b in battles
-            ])
-
-    async def remove_duplicate_battles(self):
+    async def iter_battle_ids(self, cutoff_date: datetime, chunk_size: int = 50_000) -> AsyncIterator[List[Tuple[str, int]]]:
+        # Streams (battle day, battle_id) pairs through a server-side cursor in chunks instead of
+        # materializing the whole table at once
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                DELETE FROM battles
-                WHERE ctid NOT IN (
-                    SELECT MIN(ctid)
-                    FROM battles
-                    GROUP BY battle_id, player_id
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(
+                    """
+                        SELECT to_char(battle_time AT TIME ZONE 'UTC', 'YYYYMMDD') AS day, battle_id
+                        FROM battle
+                        WHERE battle_time >= $1
+                    """,
+                    cutoff_date,
+                    prefetch=chunk_size
                 )
+                while rows := await cursor.fetch(chunk_size):
+                    yield [(row['day'], row['battle_id']) for row in rows]
+
+    async def queue_battles(self, battles: List[Tuple], participants: List[Tuple]):
+        self.queued_battles += len(battles)
+        self.pending_battles.extend(battles)
+        self.pending_participants.extend(participants)
+        if len(self.pending_participants) >= self.max_pending_rows:
+            # Backpressure: workers wait for the flush instead of growing the buffer without bound
+            await self.flush()
+        elif len(self.pending_participants) >= self.flush_rows:
+            self.flush_requested.set()
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.pending_battles:
+                return
+            battles, self.pending_battles = self.pending_battles, []
+            participants, self.pending_participants = self.pending_participants, []
+            started = time.perf_counter()
+            try:
+                async with self.pool.acquire() as conn:
+                    # Created outside the merge transaction, so the lock on the parent table is held only briefly
+                    days = {battle[1].date() for battle in battles}
+                    if missing := {day for day in days if partition_range(day)[0] not in self.partitions}:
+                        self.partitions |= await create_partitions(conn, missing)
+                    async with conn.transaction():
+                        await conn.copy_records_to_table(self.battle_staging, records=battles, columns=BATTLE_COLUMNS)
+                        await conn.copy_records_to_table(self.participant_staging, records=participants, columns=PARTICIPANT_COLUMNS)
+                        await self.merge_staging(conn)
+                FLUSH_LATENCY.observe(time.perf_counter() - started)
+                FLUSH_SIZE.observe(len(battles))
+                FLUSHED_ROWS.inc(len(battles), table='battle')
+                FLUSHED_ROWS.inc(len(participants), table='battle_participant')
+            except Exception as e:
+                FLUSH_ERRORS.inc()
+                # Keep the rows for the next flush as long as the buffer has room for them
+                if len(self.pending_participants) + len(participants) <= self.max_pending_rows:
+                    self.pending_battles[:0] = battles
+                    self.pending_participants[:0] = participants
+                    logger.error(f"Error flushing {len(battles)} battles, retrying on next flush: {str(e)}")
+                else:
+                    logger.error(f"Error flushing {len(battles)} battles, dropped them: {str(e)}")
+
+    async def merge_staging(self, conn):
+        # New names get a code first. Filtering on NOT EXISTS keeps ON CONFLICT from burning identity values
+        for table, staging, column in [
+            ('game_mode', self.battle_staging, 'game_mode'),
+            ('game_map', self.battle_staging, 'game_map'),
+            ('game_type', self.battle_staging, 'game_type'),
+            ('brawler', self.participant_staging, 'brawler')
+        ]:
+            await conn.execute(f"""
+                INSERT INTO {table} (name)
+                SELECT DISTINCT s.{column} FROM {staging} s
+                WHERE s.{column} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {table} d WHERE d.name = s.{column})
+                ON CONFLICT (name) DO NOTHING
             """)
+        # Like the rollups, the daily stats only count battles that were actually inserted
+        await conn.execute(DAILY_STATS_STATEMENT.format(battles=f"""
+            WITH battles AS (
+                INSERT INTO battle (battle_id, battle_time, mode_id, map_id, type_id, result)
+                SELECT s.battle_id, s.battle_time, gm.id, mp.id, gt.id, s.result
+                FROM {self.battle_staging} s
+                JOIN game_mode gm ON gm.name = s.game_mode
+                LEFT JOIN game_map mp ON mp.name = s.game_map
+                JOIN game_type gt ON gt.name = s.game_type
+                ON CONFLICT (battle_id, battle_time) DO NOTHING
+                RETURNING battle_time, type_id, mode_id
+            )
+        """))
+        # Only rows that were actually inserted feed the rollups, so re-crawled battles aren't counted twice
+        await conn.execute(rollup_statement(f"""
+            WITH participants AS (
+                INSERT INTO battle_participant (battle_id, battle_time, player_id, side, brawler_id, power, rank)
+                SELECT s.battle_id, s.battle_time, s.player_id, s.side, b.id, s.power, s.rank
+                FROM {self.participant_staging} s
+                JOIN brawler b ON b.name = s.brawler
+                ON CONFLICT (battle_id, player_id, battle_time) DO NOTHING
+                RETURNING battle_id, battle_time, side, brawler_id, rank
+            )
+        """))
+        await conn.execute(f"TRUNCATE {self.battle_staging}, {self.participant_staging}")
+
+    async def flush_periodically(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+            await self.flush()
 
     async def cleanup(self):
-        await self.pool.close()
\ No newline at end of file
+        # Drain everything still buffered before closing the pool
+        self.closing = True
+        self.flush_requested.set()
+        if self.flush_task is not None:
+            await self.flush_task
+        await self.flush()
+        await self.pool.close()
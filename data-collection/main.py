@@ -1,110 +1,44 @@
 import asyncio
 import logging
-import json
-from brawl_stars_api import get_top_players, get_player_battlelog
+from brawl_stars_api import BRAWL_STARS_TOKENS, BrawlStarsAPI
 from database import Database
-from collections import deque
-from datetime import datetime, timezone
+from crawl_scheduler import CrawlScheduler
+from crawl_checkpoint import CrawlCheckpoint
+from battle_index import SeenBattleIndex, create_battle_index
+from battle_parser import BattleParser, parse_battle_time
+from sharding import ShardProgress, ShardRouter, run_coordinator, run_shard, shard_of
+import metrics
+from datetime import datetime, timedelta, timezone
 import os
+import time
 
-async def get_top_players_ids() -> list[str]:
-    top_players = await get_top_players()
-    return [player["tag"] for player in top_players["items"]]
+async def get_top_players(api: BrawlStarsAPI) -> list[tuple[str, int]]:
+    top_players = await api.get_top_players()
+    return [(player["tag"], player["trophies"]) for player in top_players["items"]]
 
-async def process_player(db: Database, player_id: str, seen_battles: set[str], processed_players: set[str], cutoff_date: datetime, minimum_trophies: int, minimum_power_league_rank: int):
-    battlelog = await get_player_battlelog(player_id)
-    battlelog = battlelog["items"]
-    new_players = []
-    battles_to_insert = []
-
-    for battle in battlelog:
-        data = dict()
-        data["game_mode"] = battle["battle"]["mode"]
-
-        if data["game_mode"] in ["soloShowdown", "duoShowdown", "duels", "bossFight"]:
-            continue
-
-        data["game_type"] = battle["battle"]["type"]
-        
-        if data["game_type"] == "friendly":
-            continue
-
-        data["battle_time"] = battle["battleTime"]
-        battle_datetime = datetime.strptime(data["battle_time"].replace('.000Z', ''), '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
-
-        if battle_datetime < cutoff_date:
-            continue
-
-        data["team1"] = battle["battle"]["teams"][0]
-        data["team2"] = battle["battle"]["teams"][1]
-
-        min_id = min([player["tag"] for player in data["team1"] + data["team2"]])
-        data["battle_id"] = data["battle_time"] + min_id
-
-        if data["battle_id"] in seen_battles:
-            continue
-        
-        seen_battles.add(data["battle_id"])
-
-        if player_id not in [player["tag"] for player in data["team1"]]:
-            data["team1"], data["team2"] = data["team2"], data["team1"]
-        
-        data["game_map"] = battle["event"]["map"]
-        data["result"] = battle["battle"]["result"]
-
-        def extract_team(team: list[dict]):
-            brawlers, powers, ranks, ids = [], [], [], []
-            for player in sorted(team, key=lambda x: x["brawler"]["name"]):
-                brawlers.append(player["brawler"]["name"])
-                powers.append(player["brawler"]["power"])
-                ranks.append(player["brawler"]["trophies"])
-                ids.append(player["tag"])
-            return json.dumps(brawlers), json.dumps(powers), json.dumps(ranks), json.dumps(ids)
-        
-        data["team"], data["team_power"], data["team_rank"], data["team_ids"] = extract_team(data["team1"])
-        data["opponents"], data["opponents_power"], data["opponents_rank"], data["opponents_ids"] = extract_team(data["team2"])
-
-        for player in data["team1"]:
-            battle_entry = data.copy()
-            battle_entry["player_id"] = player["tag"]
-            battle_entry["brawler"] = player["brawler"]["name"]
-            battle_entry["power"] = player["brawler"]["power"]
-            battle_entry["rank"] = player["brawler"]["trophies"]
-            battles_to_insert.append(battle_entry)
-            if player["tag"] not in processed_players:
-                new_players.append(player["tag"])
-                processed_players.add(player["tag"])
-
-        if data["result"] == "victory":
-            data["result"] = "defeat"
-        elif data["result"] == "defeat":
-            data["result"] = "victory"
-        
-        data["team"], data["opponents"] = data["opponents"], data["team"]
-        data["team_power"], data["opponents_power"] = data["opponents_power"], data["team_power"]
-        data["team_rank"], data["opponents_rank"] = data["opponents_rank"], data["team_rank"]
-        data["team_ids"], data["opponents_ids"] = data["opponents_ids"], data["team_ids"]
-
-        for player in data["team2"]:
-            battle_entry = data.copy()
-            battle_entry["player_id"] = player["tag"]
-            battle_entry["brawler"] = player["brawler"]["name"]
-            battle_entry["power"] = player["brawler"]["power"]
-            battle_entry["rank"] = player["brawler"]["trophies"]
-            if (data["game_type"] == "ranked" and battle_entry["rank"] >= minimum_trophies) or (data["game_type"] == "soloRanked" and battle_entry["rank"] >= minimum_power_league_rank):
-                battles_to_insert.append(battle_entry)
-            if player["tag"] not in processed_players:
-                new_players.append(player["tag"])
-                processed_players.add(player["tag"])
+async def process_player(api: BrawlStarsAPI, db: Database, parser: BattleParser, player_id: str, seen_battles: SeenBattleIndex, scheduler: CrawlScheduler) -> list[tuple[str, int]]:
+    battlelog = await api.get_player_battlelog(player_id)
+    started = time.perf_counter()
+    battles_to_insert, participants_to_insert, new_players = parser.parse(player_id, battlelog["items"], seen_battles)
+    metrics.PARSE_LATENCY.observe(time.perf_counter() - started)
         
     if battles_to_insert:
-        await db.insert_battles(battles_to_insert)
-    
-    return seen_battles, processed_players, new_players
+        await db.queue_battles(battles_to_insert, participants_to_insert)
 
-async def main():
+    # How often the player battles (in any mode) tells the scheduler how soon they're worth revisiting
+    scheduler.record_battles(player_id, [parse_battle_time(entry["battleTime"]).timestamp() for entry in battlelog["items"]])
     
-    logging.basicConfig(level=logging.INFO)
+    return new_players
+
+def shard_tokens(shard: int, shards: int, tokens: list[str] = BRAWL_STARS_TOKENS) -> tuple[list[str], float | None]:
+    # Shards split the tokens between them. With fewer tokens than shards, shards share a token and its rate limit
+    if len(tokens) >= shards:
+        return tokens[shard::shards], None
+    sharing = len(range(shard % len(tokens), shards, len(tokens)))
+    return [tokens[shard % len(tokens)]], float(os.getenv('BRAWL_STARS_RATE_LIMIT', 20)) / sharing
+
+async def crawl(shard: int = 0, shards: int = 1, inboxes: list | None = None, counters=None):
+    # With shards > 1 this process only crawls the players whose tag hashes to its shard and hands the others off
     logger = logging.getLogger(__name__)
  
     if not (cutoff_date_env := os.getenv('CUTOFF_DATE')):
@@ -113,60 +47,124 @@ async def main():
     cutoff_date = datetime.strptime(cutoff_date_env, '%Y-%m-%d').replace(tzinfo=timezone.utc)
     minimum_trophies = int(os.getenv('MINIMUM_TROPHIES', 0))
     minimum_power_league_rank = int(os.getenv('MINIMUM_POWER_LEAGUE_RANK', 0))
+    battle_index_retention_days = int(os.getenv('BATTLE_INDEX_RETENTION_DAYS', 0))
     
     # Connect and initialize the postgres database
     logger.info("Connecting and initializing database...")
-    db = await Database.create()
+    db = await Database.create(f'staging_{shard}' if shards > 1 else 'staging')
+
+    # Single HTTP client shared by all workers, so connections are reused across players
+    api = await BrawlStarsAPI.create(*shard_tokens(shard, shards))
     
-    # Get unique battle ids from the database to avoid duplicates
+    # Get unique battle ids from the database to avoid duplicates (the database's ON CONFLICT stays the source of truth)
     logger.info("Getting unique battle ids...")
-    seen_battles = set(await db.get_unique_battle_ids()) 
+    seen_battles = create_battle_index()
+    async for battle_keys in db.iter_battle_ids(cutoff_date):
+        seen_battles.update_keys(battle_keys)
+    logger.info(f"Loaded {len(seen_battles)} battle ids since {cutoff_date.date()}")
+
+    # Players are revisited once they've likely played enough new battles, based on their estimated battle rate.
+    # The request budget is global, so shards split it
+    scheduler = CrawlScheduler(
+        workers=int(os.getenv('CRAWLER_WORKERS', 20)),
+        max_frontier=int(os.getenv('CRAWLER_MAX_FRONTIER', 200_000)),
+        players_per_loop=int(os.getenv('CRAWLER_PLAYERS_PER_LOOP', 500_000)),
+        min_revisit=float(os.getenv('CRAWLER_MIN_REVISIT', 600)),
+        max_revisit=float(os.getenv('CRAWLER_MAX_REVISIT', 86_400)),
+        revisit_battles=float(os.getenv('CRAWLER_REVISIT_BATTLES', 20)),
+        request_budget=float(os.getenv('CRAWLER_REQUEST_BUDGET', 0)) / shards
+    )
+
+    # Resume from the last checkpoint's frontier and crawl times instead of starting over from the top players
+    checkpoint = CrawlCheckpoint(db.pool, shard, shards, float(os.getenv('CRAWLER_CHECKPOINT_INTERVAL', 60)))
+    await checkpoint.initialize()
+    players, frontier = await checkpoint.load(scheduler)
+    logger.info(f"Resumed {players:,} recently crawled players and a frontier of {frontier:,}")
+
+    parser = BattleParser(cutoff_date, minimum_trophies, minimum_power_league_rank)
+
+    # Other shards' battles only reach this index through the database, whose ON CONFLICT deduplicates across shards
+    router = ShardRouter(shard, inboxes) if shards > 1 else None
+    progress = ShardProgress(counters) if counters is not None else None
+    processed = 0
+
+    # Each process serves its own metrics, on consecutive ports when sharded
+    metrics.FRONTIER_SIZE.function = scheduler.queue.qsize
+    metrics.PLANNED_REVISITS.function = lambda: len(scheduler.planned)
+    metrics.BUSY_WORKERS.function = lambda: scheduler.busy
+    metrics.WORKER_UTILIZATION.function = lambda: scheduler.busy / scheduler.workers
+    metrics.PENDING_ROWS.function = lambda: len(db.pending_participants)
+    metrics.SEEN_BATTLES.function = lambda: len(seen_battles)
+    metrics.SEEN_LOOKUPS.function = lambda: parser.lookups
+    metrics.SEEN_HITS.function = lambda: parser.duplicates
+    metrics_port = int(os.getenv('CRAWLER_METRICS_PORT', 9108))
+    metrics_server = await metrics.start_metrics_server(metrics_port + shard) if metrics_port else None
+
+    # Per-player logging is sampled, at full crawl rate a line per player costs more than it tells
+    log_every = max(1, int(os.getenv('CRAWLER_LOG_EVERY', 1000)))
+
+    async def handle_player(player_id: str) -> list[tuple[str, int]]:
+        nonlocal processed
+        new_players = await process_player(api, db, parser, player_id, seen_battles, scheduler)
+        processed += 1
+        metrics.PLAYERS_PROCESSED.inc()
+        if router is None:
+            if processed % log_every == 0:
+                logger.info(f"Processed player {player_id}. Players: {scheduler.processed}, Frontier: {scheduler.queue.qsize()}, Battles: {len(seen_battles)}")
+            return new_players
+        new_players = router.route(new_players)
+        progress.set(shard, players=processed, battles=db.queued_battles, frontier=scheduler.queue.qsize(), sent=router.sent, received=router.received)
+        return new_players
+
+    receiver = asyncio.create_task(router.receive(scheduler.add)) if router is not None else None
+    checkpointer = asyncio.create_task(checkpoint.save_periodically(scheduler))
     
-    # Loops, so players can be reprocessed (processed_players resets)
-    while True:
-        try:
-            # Get top players' ids for initial queue (high ranking battles + their battle logs constantly update)
-            logger.info("Getting top players ids...")
-            queue = deque(await get_top_players_ids())
-
-            # Prevents reprocessing a player in the same loop iteration (gives time for player battle logs to update)
-            processed_players = set(queue)
-
-            async def worker():
-
-                while queue:
-                    player_id = queue.popleft()
-                    try:
-                        seen_battles_local, processed_players_local, new_players = await process_player(db, player_id, seen_battles, processed_players, cutoff_date, minimum_trophies, minimum_power_league_rank)
-                        seen_battles.update(seen_battles_local)
-                        processed_players.update(processed_players_local)
-                        queue.extend(new_players)
-                        logger.info(f"Processed player {player_id}. Players: {len(processed_players)}, Battles: {len(seen_battles)}")
-                    except Exception as e:
-                        logger.error(f"Error processing player {player_id}: {str(e)}")
-
-            workers = []
-
-            # Create 20 workers
-            logger.info("Creating workers...")
-            for _ in range(20):
-                workers.append(asyncio.create_task(worker()))
-            
-            # Wait 500k processed players before cutting off workers to reset the loop
-            logger.info(f"Waiting for {500_000} players to be processed...")
-            while len(processed_players) < 500_000:
-                await asyncio.sleep(5)
-            
-            # Cancel all workers
-            logger.info("Cancelling workers...")
-            for w in workers:
-                w.cancel()
-            
-            # Restart the loop
-            logger.info(f"Finished a loop. Current total battles: {len(seen_battles)}")
-            
-        except Exception as e:
-            logger.error(f"An error occurred during data collection: {str(e)}", exc_info=True)
+    # Loops, so the top players are fetched again (each is only crawled again once it's due)
+    try:
+        while True:
+            try:
+                # Get top players' ids for initial queue (high ranking battles + their battle logs constantly update)
+                logger.info("Getting top players ids...")
+                top_players = [(player_id, trophies) for player_id, trophies in await get_top_players(api) if shard_of(player_id, shards) == shard]
+
+                # Workers drain cooperatively once the loop's player budget is reached or the frontier runs dry
+                logger.info(f"Crawling with {scheduler.workers} workers until {scheduler.players_per_loop:,} players are processed...")
+                await scheduler.run(handle_player, top_players)
+
+                # Battles older than the cutoff (or the retention window) can't be inserted again, so drop their shards
+                if battle_index_retention_days:
+                    seen_battles.evict_before(max(cutoff_date, datetime.now(timezone.utc) - timedelta(days=battle_index_retention_days)))
+
+                # Restart the loop, after a pause if no player was due so the top players aren't fetched in a tight loop
+                logger.info(f"Finished a loop. Players processed: {scheduler.processed}, Current total battles: {len(seen_battles)}")
+                if not scheduler.processed:
+                    await asyncio.sleep(min(scheduler.min_revisit, 60))
+
+            except Exception as e:
+                logger.error(f"An error occurred during data collection: {str(e)}", exc_info=True)
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        checkpointer.cancel()
+        await checkpoint.save(scheduler)
+        if metrics_server is not None:
+            await metrics_server.cleanup()
+        await api.cleanup()
+        await db.cleanup()
+
+def crawl_shard(shard: int, shards: int, inboxes: list, counters):
+    # Entry point of each crawler process, with its own event loop, API tokens and database pool
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s shard {shard} %(levelname)s %(name)s: %(message)s")
+    run_shard(crawl(shard, shards, inboxes, counters))
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    # One process per shard scales parsing and inserts past a single core
+    if (processes := int(os.getenv('CRAWLER_PROCESSES', 1))) > 1:
+        run_coordinator(crawl_shard, processes, float(os.getenv('CRAWLER_PROGRESS_INTERVAL', 30)))
+    else:
+        asyncio.run(crawl())
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
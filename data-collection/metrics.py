@@ -0,0 +1,120 @@
+import bisect
+import logging
+from typing import Callable
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Minimal Prometheus text-format metrics. Updates are plain dict and list operations, cheap enough for the hot path,
+# and values read from elsewhere (queue sizes, index sizes) are computed only when scraped
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Metric:
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, function: Callable[[], float] | None = None):
+        self.name = name
+        self.help = help
+        # Values keyed by sorted (label, value) pairs
+        self.values: dict[tuple, float] = {}
+        self.function = function
+        REGISTRY.append(self)
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, (), self.function()
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+        # Per label set: per-bucket (non-cumulative) counts with a final +Inf slot, and the sum of observations
+        self.counts: dict[tuple, list[int]] = {}
+        self.sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        if (counts := self.counts.get(key)) is None:
+            counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] = self.sums.get(key, 0) + value
+
+    def samples(self):
+        for labels, counts in self.counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                yield f"{self.name}_bucket", (*labels, ("le", str(bound))), total
+            yield f"{self.name}_count", labels, total
+            yield f"{self.name}_sum", labels, self.sums[labels]
+
+REGISTRY: list[Metric] = []
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(f"{name}{format_labels(labels)} {value}" for name, labels, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+async def start_metrics_server(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    # Serves GET /metrics on the crawler's own event loop
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
+
+# Crawler metrics, shared by the modules that update them
+
+HTTP_LATENCY = Histogram("brawlstars_http_request_seconds", "Brawl Stars API time to response headers, including throttled and failed attempts")
+HTTP_RESPONSES = Counter("brawlstars_http_responses_total", "Brawl Stars API responses by endpoint and status (status 0 for connection errors and timeouts)")
+PARSE_LATENCY = Histogram("crawler_parse_seconds", "Time to normalize one battlelog", buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025))
+PLAYERS_PROCESSED = Counter("crawler_players_processed_total", "Players whose battlelog was processed")
+FLUSH_LATENCY = Histogram("database_flush_seconds", "Time to COPY and merge one buffered batch")
+FLUSH_SIZE = Histogram("database_flush_battles", "Battles per flushed batch", buckets=(100, 500, 1000, 2500, 5000, 10_000, 25_000, 50_000))
+FLUSHED_ROWS = Counter("database_flushed_rows_total", "Rows sent by flushes, by table (before ON CONFLICT drops already stored ones)")
+FLUSH_ERRORS = Counter("database_flush_errors_total", "Flushes that failed")
+
+# Read from the crawl's objects when scraped, main binds their functions once the objects exist
+FRONTIER_SIZE = Gauge("crawler_frontier_players", "Players waiting in the crawl queue")
+PLANNED_REVISITS = Gauge("crawler_planned_revisits", "Players with a revisit waiting to come due")
+BUSY_WORKERS = Gauge("crawler_busy_workers", "Workers currently processing a player")
+WORKER_UTILIZATION = Gauge("crawler_worker_utilization", "Fraction of workers currently processing a player")
+PENDING_ROWS = Gauge("database_pending_participant_rows", "Participant rows buffered for the next flush")
+SEEN_BATTLES = Gauge("crawler_seen_battles", "Battles in the seen-battle index")
+SEEN_LOOKUPS = Counter("crawler_seen_battle_lookups_total", "Battles looked up in the seen-battle index")
+SEEN_HITS = Counter("crawler_seen_battle_hits_total", "Lookups that found an already seen battle")
@@ -0,0 +1,83 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+class TokenBucket:
+
+    def __init__(self, token: str, rate: float, capacity: float, min_rate: float):
+        self.token = token
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        # Every request takes a whole token, so a bucket smaller than one token (e.g. a budget below 1/s) would never fill
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        now = time.monotonic()
+        self.refill(now)
+        return max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in FIFO order
+        async with self.lock:
+            while (delay := self.wait_time()) > 0:
+                await asyncio.sleep(delay)
+            self.tokens -= 1
+
+    def throttle(self, retry_after: float | None):
+        # Multiplicative decrease on 429/503, and pause the bucket for as long as the server asked
+        now = time.monotonic()
+        self.refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def recover(self):
+        # Additive increase back towards the configured rate after each success
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+class RateLimiter:
+
+    def __init__(self, tokens: list[str], rate: float, capacity: float | None = None, min_rate: float | None = None):
+        if not tokens:
+            raise ValueError("At least one API token is required")
+        self.buckets = [
+            TokenBucket(token, rate, capacity or max(1.0, rate), min_rate or rate / 20)
+            for token in tokens
+        ]
+
+    async def acquire(self) -> TokenBucket:
+        # Use the token whose budget frees up first
+        bucket = min(self.buckets, key=lambda b: b.wait_time())
+        await bucket.acquire()
+        return bucket
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # Full jitter: spreads retries out so workers throttled together don't come back together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,103 @@
+import asyncio
+from collections import defaultdict
+from database import DICTIONARY_TABLES
+from scripts.scoring import TEAM_FETCH_MIN_GAMES
+
+def bucket_levels_query(rollup: str, key: str, bucket_families: dict[str, list[int]], mode_filter: bool) -> str:
+    # Rows are grouped by bucket level (width_bucket: 1 for the lowest bucket, 0 below it) instead of exact
+    # rank, so one scan serves every family and far fewer rows come back
+    levels = " ".join(f"WHEN '{game_type}' THEN width_bucket(r.rank::int, array{buckets})" for game_type, buckets in bucket_families.items())
+    return f"""
+        SELECT *
+        FROM (
+            SELECT
+                gt.name AS game_type,
+                r.mode_id,
+                r.map_id,
+                r.{key} AS key,
+                CASE gt.name {levels} END AS level,
+                SUM(r.games)::bigint AS games,
+                SUM(r.victories)::bigint AS victories
+            FROM {rollup} r
+            JOIN game_type gt ON gt.id = r.type_id
+            WHERE gt.name = ANY($1::text[]) {"AND r.mode_id = $2" if mode_filter else ""}
+            GROUP BY gt.name, r.mode_id, r.map_id, r.{key}, level
+        ) levels
+        WHERE level > 0
+    """
+
+def cumulative_buckets(rows, buckets: list[int]) -> dict:
+    # Suffix sums over bucket levels give "rank >= bucket" totals for every bucket at once
+    totals = defaultdict(lambda: [[0, 0] for _ in buckets])
+    for row in rows:
+        key = tuple(row['key']) if isinstance(row['key'], list) else row['key']
+        level = totals[(row['mode_id'], row['map_id'], key)][row['level'] - 1]
+        level[0] += row['games']
+        level[1] += row['victories']
+    for levels in totals.values():
+        for i in range(len(levels) - 2, -1, -1):
+            levels[i][0] += levels[i + 1][0]
+            levels[i][1] += levels[i + 1][1]
+    return totals
+
+def to_records(rows, buckets: list[int], dictionaries: dict, key_name: str, decode_key, min_games: int = 0) -> list[dict]:
+    records = []
+    for (mode_id, map_id, key), levels in cumulative_buckets(rows, buckets).items():
+        for bucket, (games, victories) in zip(buckets, levels):
+            if games > 0 and games >= min_games:
+                records.append({
+                    'game_mode': dictionaries['game_mode'].get(mode_id),
+                    'game_map': dictionaries['game_map'].get(map_id),
+                    'bucket': bucket,
+                    key_name: decode_key(key),
+                    'games_played': games,
+                    'victories': victories
+                })
+    return records
+
+async def fetch_levels(conn, trophy_buckets: list[int], rank_buckets: list[int], mode_id: int | None = None):
+    families = {'ranked': trophy_buckets, 'soloRanked': rank_buckets}
+    args = [list(families)] + ([mode_id] if mode_id is not None else [])
+    brawler_rows = await conn.fetch(bucket_levels_query('brawler_rollup', 'brawler_id', families, mode_id is not None), *args)
+    args[0] = ['ranked']
+    team_rows = await conn.fetch(bucket_levels_query('team_rollup', 'team', {'ranked': trophy_buckets}, mode_id is not None), *args)
+    return brawler_rows, team_rows
+
+async def fetch_mode_levels(connect, snapshot: str, trophy_buckets: list[int], rank_buckets: list[int], mode_id: int):
+    conn = await connect()
+    try:
+        # Every connection reads the snapshot exported by the coordinating transaction
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            await conn.execute(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+            return await fetch_levels(conn, trophy_buckets, rank_buckets, mode_id)
+    finally:
+        await conn.close()
+
+async def fetch_all_stats(conn, trophy_buckets: list[int], rank_buckets: list[int], connect=None, parallel: int = 0):
+    # Brawler-trophy, brawler-rank and team records from one pass over the rollups inside one snapshot. With
+    # parallel > 0 and a connect() factory, game modes are split across that many extra connections sharing it
+    async with conn.transaction(isolation='repeatable_read', readonly=True):
+        dictionaries = {
+            table: {row['id']: row['name'] for row in await conn.fetch(f"SELECT id, name FROM {table}")}
+            for table in DICTIONARY_TABLES
+        }
+
+        if parallel and connect is not None:
+            snapshot = await conn.fetchval("SELECT pg_export_snapshot()")
+            semaphore = asyncio.Semaphore(parallel)
+
+            async def fetch_mode(mode_id):
+                async with semaphore:
+                    return await fetch_mode_levels(connect, snapshot, trophy_buckets, rank_buckets, mode_id)
+
+            results = await asyncio.gather(*(fetch_mode(mode_id) for mode_id in dictionaries['game_mode']))
+            brawler_rows = [row for rows, _ in results for row in rows]
+            team_rows = [row for _, rows in results for row in rows]
+        else:
+            brawler_rows, team_rows = await fetch_levels(conn, trophy_buckets, rank_buckets)
+
+    brawlers = dictionaries['brawler']
+    trophy_records = to_records([row for row in brawler_rows if row['game_type'] == 'ranked'], trophy_buckets, dictionaries, 'brawler', brawlers.get)
+    power_league_records = to_records([row for row in brawler_rows if row['game_type'] == 'soloRanked'], rank_buckets, dictionaries, 'brawler', brawlers.get)
+    team_records = to_records(team_rows, trophy_buckets, dictionaries, 'team', lambda team: sorted(brawlers[brawler_id] for brawler_id in team), min_games=TEAM_FETCH_MIN_GAMES)
+    return trophy_records, power_league_records, team_records
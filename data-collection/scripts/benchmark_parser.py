@@ -0,0 +1,75 @@
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+from api_schema import decode_battlelog, msgspec, orjson
+from battle_index import SeenBattleIndex
+from battle_parser import BattleParser, parse_battle_time
+
+BRAWLERS = ["SHELLY", "COLT", "BULL", "BROCK", "RICO", "SPIKE", "BARLEY", "JESSIE", "NITA", "DYNAMIKE", "EL PRIMO", "MORTIS", "CROW", "POCO", "BO", "PIPER"]
+MODES = ["gemGrab", "brawlBall", "heist", "bounty", "knockout", "hotZone", "soloShowdown"]
+
+def random_tag(rng: random.Random) -> str:
+    return "#" + "".join(rng.choices("0289PYLQGRJCUV", k=9))
+
+def battlelog(rng: random.Random, player_id: str, now: datetime, size: int = 25) -> list:
+    # Shaped like the API's battlelog items, with the fields the API sends but the crawler ignores
+    items = []
+    for i in range(size):
+        battle_time = (now - timedelta(minutes=4 * i + rng.randint(0, 3))).strftime("%Y%m%dT%H%M%S.000Z")
+        teams = [[{
+            "tag": tag,
+            "name": "player",
+            "brawler": {"id": 16000000, "name": rng.choice(BRAWLERS), "power": rng.randint(1, 11), "trophies": rng.randint(0, 1250)}
+        } for tag in tags] for tags in ([player_id] + [random_tag(rng) for _ in range(2)], [random_tag(rng) for _ in range(3)])]
+        items.append({
+            "battleTime": battle_time,
+            "event": {"id": 15000000, "mode": "gemGrab", "map": "Hard Rock Mine"},
+            "battle": {
+                "mode": rng.choice(MODES),
+                "type": rng.choice(["ranked", "ranked", "soloRanked", "friendly"]),
+                "result": rng.choice(["victory", "defeat", "draw"]),
+                "duration": 120,
+                "starPlayer": teams[0][0],
+                "teams": teams
+            }
+        })
+    return items
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=2000, help='Synthetic battlelogs to parse per run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    players = [random_tag(rng) for _ in range(args.players)]
+    logs = [battlelog(rng, player_id, now) for player_id in players]
+    battle_parser = BattleParser(now - timedelta(days=1))
+
+    def parse_all():
+        # A fresh index per run, so every battle takes the full normalization path
+        seen_battles = SeenBattleIndex()
+        return sum(len(battle_parser.parse(player_id, log, seen_battles)[0]) for player_id, log in zip(players, logs))
+
+    battles = parse_all()
+    best = min(timeit.repeat(parse_all, number=1, repeat=args.repeat))
+    entries = args.players * len(logs[0])
+    print(f"\nParsed {entries:,} battlelog entries ({battles:,} kept) in {best * 1000:.1f} ms")
+    print(f"{entries / best:,.0f} entries/s, {best / args.players * 1e6:.1f} us per battlelog")
+
+    sample = logs[0][0]["battleTime"]
+    strptime = min(timeit.repeat(lambda: datetime.strptime(sample.replace('.000Z', ''), '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc), number=100_000, repeat=args.repeat))
+    fixed = min(timeit.repeat(lambda: parse_battle_time(sample), number=100_000, repeat=args.repeat))
+    body = json.dumps({"items": logs[0]}).encode()
+    stdlib = min(timeit.repeat(lambda: json.loads(body), number=1000, repeat=args.repeat))
+    fast = min(timeit.repeat(lambda: decode_battlelog(body), number=1000, repeat=args.repeat))
+    decoder = "msgspec schema" if msgspec is not None else "orjson" if orjson is not None else "stdlib"
+    print(f"\nBattlelog decoding: stdlib json {stdlib * 1000:.1f} us, {decoder} {fast * 1000:.1f} us")
+    print(f"\nTimestamp parsing: strptime {strptime * 10:.2f} us, fixed offsets {fixed * 10:.2f} us")
+
+if __name__ == "__main__":
+    main()
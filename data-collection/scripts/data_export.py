@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_INDEX = '.hashes.json'
+COMPRESSORS = {
+    'gz': lambda payload: gzip.compress(payload, compresslevel=9, mtime=0),
+    'br': lambda payload: brotli.compress(payload, quality=11)
+}
+
+def encode(payload) -> bytes:
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+
+class DataExporter:
+
+    def __init__(self, root: str = 'data', workers: int = 8, compress: list[str] = ()):
+        for suffix in compress:
+            if suffix not in COMPRESSORS:
+                raise ValueError(f"Unknown compression '{suffix}'")
+            if suffix == 'br' and brotli is None:
+                raise RuntimeError("❌ Brotli output needs the brotli package (pip install brotli)")
+
+        # root is a symlink to the current export in the versions directory, repointed atomically on commit
+        self.root = root.rstrip(os.sep)
+        self.versions = f"{self.root}.versions"
+        self.staging = None
+        self.workers = workers
+        self.compress = list(compress)
+        self.files = {}
+
+    def add(self, path: str, payload) -> str:
+        # Paths are relative to the export root, e.g. 'gemgrab/Hard Rock Mine/trophies/brawler-700-trophies.json'.
+        # Returns the content hash, which manifests use for cache busting
+        data = encode(payload)
+        digest = hashlib.sha256(data).hexdigest()
+        self.files[path] = (data, digest)
+        return digest
+
+    def load_hashes(self) -> dict:
+        try:
+            with open(os.path.join(self.root, HASH_INDEX)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def write_file(self, path: str, data: bytes, digest: str, old_hashes: dict):
+        target = os.path.join(self.staging, path)
+
+        outputs = [(target, None)] + [(f"{target}.{suffix}", suffix) for suffix in self.compress]
+        if old_hashes.get(path) == digest:
+            # Unchanged since the last export: hard link the live files instead of rewriting and recompressing them
+            try:
+                for output, _ in outputs:
+                    os.link(os.path.join(self.root, os.path.relpath(output, self.staging)), output)
+                return digest, False
+            except OSError:
+                for output, _ in outputs:
+                    if os.path.exists(output):
+                        os.remove(output)
+
+        for output, suffix in outputs:
+            with open(output, 'wb') as f:
+                f.write(data if suffix is None else COMPRESSORS[suffix](data))
+        return digest, True
+
+    def publish(self):
+        # A new symlink replaces the old one with a single rename, so readers resolving root see either the previous
+        # export or the new one but never a mix or nothing. An export tree from before the symlink layout is moved
+        # into the versions directory once, the only time root is briefly missing
+        if os.path.isdir(self.root) and not os.path.islink(self.root):
+            os.rename(self.root, os.path.join(self.versions, 'legacy'))
+        link = f"{self.root}.link"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.relpath(self.staging, os.path.dirname(self.root) or '.'), link)
+        os.replace(link, self.root)
+
+    def prune(self, keep: int = 2):
+        # The previous version stays around for readers still holding files from it, older ones are removed
+        for name in sorted(os.listdir(self.versions), key=lambda name: os.path.getmtime(os.path.join(self.versions, name)))[:-keep]:
+            shutil.rmtree(os.path.join(self.versions, name), ignore_errors=True)
+
+    def commit(self) -> tuple[int, int]:
+        # Everything is written into a new version directory, which is only published once complete
+        old_hashes = self.load_hashes()
+        self.staging = os.path.join(self.versions, str(time.time_ns()))
+        os.makedirs(self.staging)
+
+        for directory in {os.path.dirname(path) for path in self.files}:
+            os.makedirs(os.path.join(self.staging, directory), exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = dict(zip(self.files, pool.map(lambda item: self.write_file(item[0], *item[1], old_hashes), self.files.items())))
+
+        with open(os.path.join(self.staging, HASH_INDEX), 'w') as f:
+            json.dump({path: digest for path, (digest, _) in results.items()}, f, separators=(',', ':'))
+
+        self.publish()
+        self.prune()
+
+        written = sum(changed for _, changed in results.values())
+        return written, len(results) - written
@@ -1,8 +1,84 @@
+import argparse
 import asyncpg
 import os
 import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from database import PARTITIONED_TABLES, list_partitions
 
-async def delete_duplicate_entries():
+PROGRESS_TABLE = """
+    CREATE TABLE IF NOT EXISTS maintenance_progress (
+        task TEXT PRIMARY KEY,
+        position TEXT NOT NULL,
+        updated TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# Legacy rows of the same (battle_id, player_id) beyond the latest one, within one battle_id range. Battle ids start
+# with the battle time, so a time range is a key range of the primary key index and chunks never scan the whole table
+DUPLICATES = """
+    SELECT ctid FROM (
+        SELECT ctid, ROW_NUMBER() OVER (PARTITION BY battle_id, player_id ORDER BY battle_time DESC) AS row_num
+        FROM battles
+        WHERE battle_id >= $1 AND battle_id < $2
+    ) d
+    WHERE row_num > 1
+"""
+
+def chunk_bounds(start: datetime, end: datetime, minutes: int):
+    while start < end:
+        yield start.strftime('%Y%m%dT%H%M%S'), (start + timedelta(minutes=minutes)).strftime('%Y%m%dT%H%M%S')
+        start += timedelta(minutes=minutes)
+
+async def estimate_duplicates(conn, chunks: list[tuple[str, str]], sample_chunks: int) -> tuple[int, int]:
+    # Counts duplicates exactly in a random sample of chunks and scales by the sampled share of rows, so the
+    # estimate costs a few chunk scans instead of a window over the whole table
+    sample = random.sample(chunks, min(sample_chunks, len(chunks)))
+    duplicates = rows = 0
+    for low, high in sample:
+        duplicates += await conn.fetchval(f"SELECT COUNT(*) FROM ({DUPLICATES}) d", low, high)
+        rows += await conn.fetchval("SELECT COUNT(*) FROM battles WHERE battle_id >= $1 AND battle_id < $2", low, high)
+    total = await conn.fetchval("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = 'battles'::regclass")
+    return (round(duplicates / rows * total) if rows else 0), len(sample)
+
+async def delete_duplicates(conn, chunks: list[tuple[str, str]], pause: float) -> int:
+    # One short transaction per chunk, with the position saved in the same transaction, so an interrupted run
+    # resumes after the last finished chunk and locks are only held briefly while the crawler keeps inserting
+    deleted = 0
+    for i, (low, high) in enumerate(chunks):
+        started = time.monotonic()
+        async with conn.transaction():
+            result = await conn.execute(f"DELETE FROM battles b USING ({DUPLICATES}) d WHERE b.ctid = d.ctid", low, high)
+            await conn.execute("""
+                INSERT INTO maintenance_progress (task, position) VALUES ('deduplicate_battles', $1)
+                ON CONFLICT (task) DO UPDATE SET position = EXCLUDED.position, updated = now()
+            """, high)
+        count = int(result.split()[1])
+        deleted += count
+        if count or (i + 1) % 100 == 0:
+            print(f"✅ {low[:8]} {low[9:13]}-{high[9:13]}: deleted {count} ({i + 1}/{len(chunks)} chunks, {deleted} total)")
+        # Throttle: rest in proportion to the work done, so the tool keeps the database busy at most 1 / (1 + pause) of the time
+        await asyncio.sleep(pause * (time.monotonic() - started))
+    return deleted
+
+async def vacuum_tables(conn, tables: list[str], min_dead_ratio: float, pause: float):
+    # Partitions are vacuumed one at a time, most dead rows first, skipping those autovacuum has kept clean
+    rows = await conn.fetch("""
+        SELECT relname, n_dead_tup, n_live_tup
+        FROM pg_stat_user_tables
+        WHERE relname = ANY($1::text[]) AND n_dead_tup > $2 * GREATEST(n_live_tup, 1)
+        ORDER BY n_dead_tup DESC
+    """, tables, min_dead_ratio)
+    if not rows:
+        print("\n✅ No table needs vacuuming")
+    for row in rows:
+        started = time.monotonic()
+        await conn.execute(f"VACUUM (ANALYZE) {row['relname']}")
+        print(f"✅ Vacuumed {row['relname']} ({row['n_dead_tup']:,} dead rows)")
+        await asyncio.sleep(pause * (time.monotonic() - started))
+
+async def delete_duplicate_entries(args):
     print("\nChecking environment variables...")
 
     for var in ['POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD']:
@@ -10,7 +86,7 @@ async def delete_duplicate_entries():
             raise EnvironmentError(f"❌ {var} not set")
 
     print("\nTrying to connect to database...")
-    
+
     try:
         conn = await asyncpg.connect(
             user=os.getenv('POSTGRES_USER'),
@@ -28,53 +104,62 @@ async def delete_duplicate_entries():
         print(f"\n❌ Unexpected error: {str(e)}")
 
     try:
-        print("\nConnection successful. Counting duplicate entries...")
-
-        count = await conn.fetchval("""
-            WITH DuplicateCTE AS (
-                SELECT battle_id, player_id,
-                       ROW_NUMBER() OVER (
-                           PARTITION BY battle_id, player_id 
-                           ORDER BY battle_time DESC
-                       ) as row_num
-                FROM battles
-            )
-            SELECT COUNT(*)
-            FROM DuplicateCTE
-            WHERE row_num > 1
-        """)
-        
-        confirmation = input(f"\n⚠️ This will delete {count} duplicate entries. Proceed? (y/N): ")
-        
-        if confirmation.lower() != 'y':
-            print("\n❌ Operation cancelled by user")
-            await conn.close()
+        vacuum = []
+        if not await conn.fetchval("SELECT to_regclass('battles')"):
+            # The normalized tables' primary keys already reject duplicates, only their partitions need maintenance
+            print("\n✅ No legacy battles table found, the battle tables can't hold duplicates")
+        else:
+            await conn.execute(PROGRESS_TABLE)
+            first_id, last_id = await conn.fetchrow("SELECT MIN(battle_id), MAX(battle_id) FROM battles")
+            if first_id is None:
+                print("\n✅ Legacy battles table is empty")
+                return
+
+            start = datetime.strptime(first_id[:8], '%Y%m%d')
+            position = None if args.restart else await conn.fetchval("SELECT position FROM maintenance_progress WHERE task = 'deduplicate_battles'")
+            chunks = [(low, high) for low, high in chunk_bounds(start, datetime.strptime(last_id[:8], '%Y%m%d') + timedelta(days=1), args.chunk_minutes) if position is None or low >= position]
+
+            print(f"\nConnection successful. Estimating duplicate entries from {args.sample_chunks} sampled chunks...")
+            estimate, sampled = await estimate_duplicates(conn, chunks, args.sample_chunks)
+            resume = f", resuming at {position}" if position else ""
+            print(f"\nAbout {estimate:,} duplicate entries in {len(chunks):,} chunks of {args.chunk_minutes} minutes{resume} (sampled {sampled} chunks)")
+
+            if args.dry_run:
+                return
+
+            confirmation = input(f"\n⚠️ This will delete about {estimate:,} duplicate entries. Proceed? (y/N): ")
+
+            if confirmation.lower() != 'y':
+                print("\n❌ Operation cancelled by user")
+                return
+
+            print("\nDeleting duplicate entries...")
+            count = await delete_duplicates(conn, chunks, args.pause)
+            await conn.execute("DELETE FROM maintenance_progress WHERE task = 'deduplicate_battles'")
+            print(f"\n✅ Successfully deleted {count} duplicate entries")
+            vacuum.append('battles')
+
+        if args.dry_run or args.no_vacuum:
             return
 
-        print("\nDeleting duplicate entries...")
-        deleted_rows = await conn.execute("""
-            WITH DuplicateCTE AS (
-                SELECT battle_id, player_id,
-                       ROW_NUMBER() OVER (
-                           PARTITION BY battle_id, player_id 
-                           ORDER BY battle_time DESC
-                       ) as row_num
-                FROM battles
-            )
-            DELETE FROM battles
-            WHERE (battle_id, player_id) IN (
-                SELECT battle_id, player_id
-                FROM DuplicateCTE
-                WHERE row_num > 1
-            )
-        """)
-        
-        count = int(deleted_rows.split()[1])
-        print(f"\n✅ Successfully deleted {count} duplicate entries")
+        print("\nVacuuming and analyzing tables with dead rows...")
+        for table in PARTITIONED_TABLES:
+            if await conn.fetchval("SELECT to_regclass($1)", table):
+                vacuum.extend(name for name, _, _ in await list_partitions(conn, table))
+        await vacuum_tables(conn, vacuum, args.min_dead_ratio, args.pause)
     except Exception as e:
         print(f"\n❌ Unexpected error: {str(e)}")
     finally:
         await conn.close()
 
 if __name__ == "__main__":
-    asyncio.run(delete_duplicate_entries())
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dry-run', action='store_true', help='Only estimate the duplicates')
+    parser.add_argument('--chunk-minutes', type=int, default=60, help='Battle time range deleted per transaction')
+    parser.add_argument('--sample-chunks', type=int, default=20, help='Chunks counted exactly for the estimate')
+    parser.add_argument('--pause', type=float, default=1, help='Seconds to rest per second of work, so the crawler keeps its share of the database')
+    parser.add_argument('--restart', action='store_true', help='Ignore the saved progress and start from the first chunk')
+    parser.add_argument('--no-vacuum', action='store_true', help="Don't vacuum and analyze afterwards")
+    parser.add_argument('--min-dead-ratio', type=float, default=0.05, help='Dead to live row ratio above which a table is vacuumed')
+    args = parser.parse_args()
+    asyncio.run(delete_duplicate_entries(args))
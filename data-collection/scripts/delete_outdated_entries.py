@@ -1,7 +1,8 @@
 import asyncio
 import asyncpg
 import os
-from datetime import datetime
+from datetime import datetime, timezone
+from database import delete_battles_between, drop_partitions_before, list_partitions
 
 async def delete_outdated_entries():
     print("\nChecking environment variables...")
@@ -11,7 +12,7 @@ async def delete_outdated_entries():
             raise EnvironmentError(f"❌ {var} not set")
     
     try:
-        cutoff_date = datetime.strptime(os.getenv('CUTOFF_DATE'), '%Y-%m-%d')
+        cutoff_date = datetime.strptime(os.getenv('CUTOFF_DATE'), '%Y-%m-%d').replace(tzinfo=timezone.utc)
     except ValueError:
         raise EnvironmentError("❌ CUTOFF_DATE must be in YYYY-MM-DD format")
 
@@ -34,29 +35,42 @@ async def delete_outdated_entries():
         print(f"\n❌ Unexpected error: {str(e)}")
 
     try:    
-        print(f"\nConnection successful. Fetching number of entries before {cutoff_date.date()}...")
+        print(f"\nConnection successful. Finding partitions before {cutoff_date.date()}...")
+
+        partitions = await list_partitions(conn, 'battle')
+        expired = [name for name, _, end in partitions if end <= cutoff_date]
+        # Only a partition straddling the cutoff (e.g. weekly partitions) still needs a row DELETE
+        straddling = [start for _, start, end in partitions if start < cutoff_date < end]
 
         count = await conn.fetchval("""
-            SELECT COUNT(*) 
-            FROM battles 
-            WHERE TO_TIMESTAMP(battle_time, 'YYYYMMDD"T"HH24MISS.MS"Z"') < $1
-        """, cutoff_date)
+            SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0)::bigint
+            FROM pg_class
+            WHERE relname = ANY($1::text[])
+        """, expired)
+        for start in straddling:
+            count += await conn.fetchval("""
+                SELECT COUNT(*) 
+                FROM battle 
+                WHERE battle_time >= $1 AND battle_time < $2
+            """, start, cutoff_date)
         
-        confirmation = input(f"\n⚠️ This will delete {count} entries before {cutoff_date.date()}. Proceed? (y/N): ")
+        confirmation = input(f"\n⚠️ This will drop {len(expired)} partitions and delete about {count} battles before {cutoff_date.date()}. Proceed? (y/N): ")
         
         if confirmation.lower() != 'y':
             print("\n❌ Operation cancelled by user")
             await conn.close()
             return
             
-        print(f"\nDeleting entries before {cutoff_date.date()}...")
-        deleted_rows = await conn.execute("""
-            DELETE FROM battles 
-            WHERE TO_TIMESTAMP(battle_time, 'YYYYMMDD"T"HH24MISS.MS"Z"') < $1
-        """, cutoff_date)
-        
-        count = int(deleted_rows.split()[1])
-        print(f"\n✅ Successfully deleted {count} entries that occurred before {cutoff_date.date()}")
+        # The removed battles are subtracted from the rollups as they go, ingestion keeps running meanwhile
+        print(f"\nDropping partitions before {cutoff_date.date()}...")
+        dropped = await drop_partitions_before(conn, cutoff_date)
+        for name in dropped:
+            print(f"✅ Dropped {name}")
+
+        for start in straddling:
+            await delete_battles_between(conn, start, cutoff_date)
+
+        print(f"\n✅ Successfully removed about {count} battles that occurred before {cutoff_date.date()}")
     except Exception as e:
         print(f"\n❌ Unexpected error: {str(e)}")
     finally:
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import asyncpg
+import json
+import os
+import shutil
+from datetime import date, datetime, time, timedelta, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+WATERMARK = '_watermark.json'
+
+# Battles stay insertable for a while after they're played (players' battlelogs reach back), so incremental runs
+# rewrite the days since the watermark minus this lookback
+DEFAULT_LOOKBACK_DAYS = 2
+
+PARTICIPANT_FIELDS = ['player_id', 'brawler_id::text', 'power::text', 'rank::text']
+LIST_COLUMNS = ['players', 'brawlers', 'powers', 'ranks']
+
+def day_query() -> str:
+    # One row per battle with each side's participants as space-separated lists in the same (player tag) order.
+    # Side 0 is the team, result is from its perspective. Both tables are bounded by battle_time, so only the
+    # day's partitions are read
+    sides = []
+    for side, prefix in ((False, 'team'), (True, 'opponents')):
+        for field, column in zip(PARTICIPANT_FIELDS, LIST_COLUMNS):
+            sides.append(f"string_agg(p.{field}, ' ' ORDER BY p.player_id) FILTER (WHERE {'' if side else 'NOT '}p.side) AS {prefix}_{column}")
+    return f"""
+        SELECT
+            b.battle_id,
+            extract(epoch FROM b.battle_time)::bigint AS battle_time,
+            b.type_id,
+            b.mode_id,
+            b.map_id,
+            b.result,
+            {', '.join(sides)}
+        FROM battle b
+        JOIN battle_participant p ON p.battle_id = b.battle_id AND p.battle_time = b.battle_time
+        WHERE b.battle_time >= $1 AND b.battle_time < $2 AND p.battle_time >= $1 AND p.battle_time < $2
+        GROUP BY b.battle_id, b.battle_time, b.type_id, b.mode_id, b.map_id, b.result
+    """
+
+async def fetch_dictionary(conn, table: str) -> 'pa.Array':
+    # Names indexed by id, so the stored codes are the dictionary indices as they are. Unused ids are empty
+    # strings, Parquet can't store nulls inside a dictionary
+    rows = await conn.fetch(f"SELECT id, name FROM {table}")
+    names = [''] * (max((row['id'] for row in rows), default=0) + 1)
+    for row in rows:
+        names[row['id']] = row['name']
+    return pa.array(names, pa.string())
+
+def encode(ids: 'pa.Array', dictionary: 'pa.Array') -> 'pa.DictionaryArray':
+    return pa.DictionaryArray.from_arrays(ids.cast(pa.int16()), dictionary)
+
+def encode_list(values: 'pa.Array', value_type, dictionary: 'pa.Array' = None) -> 'pa.ListArray':
+    # Splits the space-separated lists into list columns, with dictionary-encoded values when a dictionary is given
+    lists = pc.split_pattern(values.fill_null(''), ' ').cast(pa.list_(value_type))
+    if dictionary is None:
+        return lists
+    return pa.ListArray.from_arrays(lists.offsets, encode(lists.flatten(), dictionary))
+
+def to_table(path: str, dictionaries: dict) -> 'pa.Table':
+    columns = {'battle_id': pa.int64(), 'battle_time': pa.int64(), 'type_id': pa.int16(), 'mode_id': pa.int16(), 'map_id': pa.int16(), 'result': pa.int8()}
+    raw = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(column_types={
+        **columns, **{f'{prefix}_{column}': pa.string() for prefix in ('team', 'opponents') for column in LIST_COLUMNS}
+    })).combine_chunks()
+
+    table = {
+        'battle_id': raw['battle_id'].chunk(0),
+        'battle_time': raw['battle_time'].chunk(0).cast(pa.timestamp('s')).cast(pa.timestamp('s', tz='UTC')),
+        'game_type': encode(raw['type_id'].chunk(0), dictionaries['game_type']),
+        'game_mode': encode(raw['mode_id'].chunk(0), dictionaries['game_mode']),
+        'game_map': encode(raw['map_id'].chunk(0), dictionaries['game_map']),
+        'result': raw['result'].chunk(0)
+    }
+    for prefix in ('team', 'opponents'):
+        table[f'{prefix}_players'] = encode_list(raw[f'{prefix}_players'].chunk(0), pa.string())
+        table[f'{prefix}_brawlers'] = encode_list(raw[f'{prefix}_brawlers'].chunk(0), pa.int16(), dictionaries['brawler'])
+        table[f'{prefix}_powers'] = encode_list(raw[f'{prefix}_powers'].chunk(0), pa.int8())
+        table[f'{prefix}_ranks'] = encode_list(raw[f'{prefix}_ranks'].chunk(0), pa.int16())
+    return pa.table(table)
+
+def write_day(root: str, day: date, table: 'pa.Table', compression: str) -> int:
+    # The day's files go into a fresh directory that then replaces the old one, so readers never see a half-written day
+    final = os.path.join(root, f'day={day}')
+    staging = f'{final}.staging'
+    shutil.rmtree(staging, ignore_errors=True)
+
+    modes = table['game_mode'].combine_chunks().dictionary_decode()
+    for mode in pc.unique(modes).to_pylist():
+        directory = os.path.join(staging, f'mode={mode}')
+        os.makedirs(directory, exist_ok=True)
+        rows = table.filter(pc.equal(modes, mode)).drop_columns(['game_mode'])
+        pq.write_table(rows.sort_by('battle_time'), os.path.join(directory, 'part-0.parquet'), compression=compression)
+
+    shutil.rmtree(final, ignore_errors=True)
+    if os.path.isdir(staging):
+        os.rename(staging, final)
+    return len(table)
+
+async def export_day(conn, root: str, day: date, dictionaries: dict, compression: str) -> int:
+    start = datetime.combine(day, time(), timezone.utc)
+    path = os.path.join(root, f'.day={day}.csv')
+    try:
+        # Streamed straight to disk by the server-side COPY, only one day is held in memory at a time
+        await conn.copy_from_query(day_query(), start, start + timedelta(days=1), output=path, format='csv', header=True)
+        return write_day(root, day, to_table(path, dictionaries), compression)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def read_watermark(root: str) -> datetime | None:
+    try:
+        with open(os.path.join(root, WATERMARK)) as f:
+            return datetime.fromisoformat(json.load(f)['battle_time'])
+    except FileNotFoundError:
+        return None
+
+def write_watermark(root: str, battle_time: datetime):
+    path = os.path.join(root, WATERMARK)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'battle_time': battle_time.isoformat(), 'exported_at': datetime.now(timezone.utc).isoformat()}, f)
+    os.replace(f'{path}.tmp', path)
+
+async def export_parquet(args):
+    if pa is None:
+        raise RuntimeError("❌ Parquet export needs the pyarrow package (pip install pyarrow)")
+
+    print("\nChecking environment variables...")
+
+    for var in ['POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD']:
+        if not os.getenv(var):
+            raise EnvironmentError(f"❌ {var} not set")
+
+    print("\nTrying to connect to database...")
+
+    try:
+        conn = await asyncpg.connect(
+            user=os.getenv('POSTGRES_USER'),
+            password=os.getenv('POSTGRES_PASSWORD'),
+            database=os.getenv('POSTGRES_DB'),
+            host=os.getenv('POSTGRES_HOST'),
+            port=os.getenv('POSTGRES_PORT'),
+            timeout=float(os.getenv('POSTGRES_TIMEOUT', 30))
+        )
+    except Exception as e:
+        print(f"\n❌ Error connecting to the database: {e}")
+        return
+
+    try:
+        os.makedirs(args.output, exist_ok=True)
+        # The daily stats list every day that has battles without touching the battle tables
+        days = [row['day'] for row in await conn.fetch("SELECT DISTINCT day FROM battle_daily_stats ORDER BY day")]
+        watermark = None if args.full else read_watermark(args.output)
+        if watermark is not None:
+            days = [day for day in days if day >= watermark.date() - timedelta(days=args.lookback_days)]
+        if not days:
+            print("\n✅ No battles to export")
+            return
+
+        print(f"\nExporting {len(days)} days from {days[0]} to {days[-1]} into {args.output}...")
+        dictionaries = {table: await fetch_dictionary(conn, table) for table in ['game_type', 'game_mode', 'game_map', 'brawler']}
+        exported = 0
+        for day in days:
+            # Each day in its own repeatable-read snapshot, so its battles and participants are consistent
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                count = await export_day(conn, args.output, day, dictionaries, args.compression)
+            exported += count
+            print(f"✅ {day}: {count:,} battles")
+
+        latest = await conn.fetchval("SELECT MAX(battle_time) FROM battle WHERE battle_time >= $1", datetime.combine(days[-1], time(), timezone.utc))
+        if latest is not None:
+            write_watermark(args.output, latest)
+        print(f"\n✅ Exported {exported:,} battles, watermark {latest}")
+    except Exception as e:
+        print(f"\n❌ Unexpected error: {str(e)}")
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default='snapshot', help='Directory of the day=/mode= partitioned Parquet files')
+    parser.add_argument('--full', action='store_true', help='Ignore the watermark and export every day')
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS, help='Days before the watermark that are exported again, for battles inserted late')
+    parser.add_argument('--compression', default='zstd', help='Parquet compression codec')
+    args = parser.parse_args()
+    asyncio.run(export_parquet(args))
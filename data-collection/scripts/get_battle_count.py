@@ -1,8 +1,9 @@
+import argparse
 import asyncpg
 import os
 import asyncio
 
-async def get_battle_count():
+async def get_battle_count(exact: bool = False):
     print("\nChecking environment variables...")
 
     for var in ['POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD']:
@@ -30,9 +31,31 @@ async def get_battle_count():
     try:
         print("\nConnection successful. Counting battles...")
 
-        total_count = await conn.fetchval("SELECT COUNT(DISTINCT battle_id) FROM battles")
-        
-        print(f"Total unique battles: {total_count:,}")
+        # Maintained on every insert, so this reads a few hundred rows instead of scanning the battle partitions
+        rows = await conn.fetch("""
+            SELECT gt.name AS game_type, gm.name AS game_mode, SUM(s.battles)::bigint AS battles, MAX(s.day) AS last_day
+            FROM battle_daily_stats s
+            JOIN game_type gt ON gt.id = s.type_id
+            JOIN game_mode gm ON gm.id = s.mode_id
+            GROUP BY gt.name, gm.name
+            ORDER BY battles DESC
+        """)
+        for row in rows:
+            print(f"  {row['game_type']:<12} {row['game_mode']:<16} {row['battles']:>14,}  (latest {row['last_day']})")
+        print(f"Total unique battles: {sum(row['battles'] for row in rows):,}")
+
+        # Planner statistics of every partition, refreshed by autovacuum
+        estimate = await conn.fetchval("""
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'battle'::regclass
+        """)
+        print(f"Planner estimate: {estimate:,}")
+
+        if exact:
+            total_count = await conn.fetchval("SELECT COUNT(*) FROM battle")
+            print(f"Exact count: {total_count:,}")
         
     except Exception as e:
         print(f"\n❌ Unexpected error: {str(e)}")
@@ -40,4 +63,7 @@ async def get_battle_count():
         await conn.close()
 
 if __name__ == "__main__":
-    asyncio.run(get_battle_count())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exact', action='store_true', help='Also count every battle row (scans all partitions)')
+    args = parser.parse_args()
+    asyncio.run(get_battle_count(args.exact))
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import asyncpg
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import aiohttp
+from datetime import datetime, timedelta, timezone
+from scripts.mock_api import add_arguments
+
+async def wait_for_server(url: str, process: subprocess.Popen, timeout: float = 600):
+    # The server generates its graph before listening, which takes a while for large graphs
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"❌ Mock API exited with code {process.returncode}")
+            try:
+                async with session.get(url) as response:
+                    return await response.json()
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.5)
+    raise TimeoutError("❌ Mock API didn't start in time")
+
+async def count_battles(conn) -> int:
+    if not await conn.fetchval("SELECT to_regclass('battle') IS NOT NULL"):
+        return 0
+    return await conn.fetchval("SELECT COUNT(*) FROM battle")
+
+async def existing_tables(conn, tables: list[str]) -> list[str]:
+    return [table for table in tables if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table)]
+
+async def load_test(args):
+    # Environment for the crawler, which reads it at import and startup. The database must be a scratch database,
+    # synthetic battles would otherwise end up in the analytics
+    os.environ.update({
+        'BRAWL_STARS_TOKEN': 'load-test',
+        'BRAWL_STARS_API_URL': f'http://127.0.0.1:{args.port}/v1',
+        'POSTGRES_DB': args.database,
+        'CUTOFF_DATE': (datetime.now(timezone.utc) - timedelta(hours=args.history_hours + 24)).strftime('%Y-%m-%d')
+    })
+    for var in ['POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_USER', 'POSTGRES_PASSWORD']:
+        if not os.getenv(var):
+            raise EnvironmentError(f"❌ {var} not set")
+
+    import main as crawler
+    from database import DICTIONARY_TABLES, PARTITIONED_TABLES, ROLLUP_TABLES, Database
+
+    # A previous run's checkpoint would mark most synthetic players as not due and its battles would preload the
+    # seen-battle index, so every run starts from an empty database for comparable numbers
+    conn = await asyncpg.connect(
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        database=args.database,
+        host=os.getenv('POSTGRES_HOST'),
+        port=os.getenv('POSTGRES_PORT')
+    )
+    try:
+        if tables := await existing_tables(conn, ['crawl_player', 'crawl_frontier', *PARTITIONED_TABLES, *ROLLUP_TABLES, *DICTIONARY_TABLES]):
+            if not args.reset:
+                raise RuntimeError(f"❌ {args.database} already holds crawler tables ({', '.join(tables)}), pass --reset to drop them")
+            print(f"\nDropping {', '.join(tables)} from {args.database}...")
+            await conn.execute(f"DROP TABLE {', '.join(tables)} CASCADE")
+    finally:
+        await conn.close()
+
+    # Flush latency is measured around Database.flush, which every buffered insert goes through
+    flush_latencies, flush = [], Database.flush
+    async def timed_flush(self):
+        rows = len(self.pending_battles)
+        started = time.perf_counter()
+        await flush(self)
+        if rows:
+            flush_latencies.append(time.perf_counter() - started)
+    Database.flush = timed_flush
+
+    print(f"\nStarting the mock API with {args.players:,} players...")
+    server = subprocess.Popen([
+        sys.executable, '-m', 'scripts.mock_api',
+        '--port', str(args.port),
+        '--players', str(args.players),
+        '--battles-per-player', str(args.battles_per_player),
+        '--history-hours', str(args.history_hours),
+        '--duration-hours', str(args.duration / 3600 + 1),
+        '--seed', str(args.seed),
+        '--latency', str(args.latency),
+        '--jitter', str(args.jitter),
+        '--throttle-rate', str(args.throttle_rate),
+        '--retry-after', str(args.retry_after)
+    ])
+    try:
+        stats_url = f'http://127.0.0.1:{args.port}/stats'
+        await wait_for_server(stats_url, server)
+
+        conn = await asyncpg.connect(
+            user=os.getenv('POSTGRES_USER'),
+            password=os.getenv('POSTGRES_PASSWORD'),
+            database=args.database,
+            host=os.getenv('POSTGRES_HOST'),
+            port=os.getenv('POSTGRES_PORT')
+        )
+        try:
+            print(f"Crawling for {args.duration:,.0f} seconds...")
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(crawler.crawl(), args.duration)
+            except asyncio.TimeoutError:
+                pass
+            elapsed = time.monotonic() - started
+
+            battles = await count_battles(conn)
+        finally:
+            await conn.close()
+
+        stats = await wait_for_server(stats_url, server)
+    finally:
+        server.terminate()
+        server.wait()
+
+    # Elapsed time includes startup (schema, index and checkpoint loading) and the final flush
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nPlayers: {stats.get('battlelogs', 0):,} ({stats.get('battlelogs', 0) / elapsed:,.1f}/s), {stats.get('throttled', 0):,} throttled responses")
+    print(f"Battles inserted: {battles:,} ({battles / elapsed:,.1f}/s)")
+    if len(flush_latencies) >= 2:
+        quantiles = statistics.quantiles(flush_latencies, n=100)
+        print(f"Flushes: {len(flush_latencies):,}, latency p50 {quantiles[49] * 1000:,.1f} ms, p99 {quantiles[98] * 1000:,.1f} ms, max {max(flush_latencies) * 1000:,.1f} ms")
+    print(f"Peak RSS: {peak_rss:,.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawls a local mock API into a scratch Postgres database and reports throughput')
+    add_arguments(parser)
+    parser.add_argument('--database', required=True, help='Scratch database to insert into (not the one used for analytics)')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to crawl for')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--reset', action='store_true', help="Drop the crawler's tables left in the database by a previous run")
+    args = parser.parse_args()
+    asyncio.run(load_test(args))
+
+if __name__ == "__main__":
+    main()
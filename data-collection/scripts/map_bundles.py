@@ -0,0 +1,63 @@
+from collections import defaultdict
+from scripts.data_export import DataExporter
+
+BUNDLE_FILE = 'bundle.json'
+MANIFEST_FILE = 'manifest.json'
+
+def columns(stats: list[dict], key: str, brawler_index) -> dict:
+    # One array per field instead of one object per row, with brawlers as indexes into the bundle's name list
+    encode = (lambda team: [brawler_index(brawler) for brawler in team]) if key == 'team' else brawler_index
+    return {
+        key: [encode(stat[key]) for stat in stats],
+        'games_played': [stat['games_played'] for stat in stats],
+        'win_rate': [round(stat['win_rate'], 5) for stat in stats],
+        'score': [stat['score'] for stat in stats]
+    }
+
+def build_bundle(views: dict) -> dict:
+    # views maps a view ('trophies', 'ranked', 'teams') to {bucket: [stats sorted by score]}
+    brawlers = sorted({
+        brawler
+        for view, buckets in views.items()
+        for stats in buckets.values()
+        for stat in stats
+        for brawler in (stat['team'] if view == 'teams' else [stat['brawler']])
+    })
+    index = {brawler: i for i, brawler in enumerate(brawlers)}
+
+    bundle = {'brawlers': brawlers}
+    for view, buckets in views.items():
+        key = 'team' if view == 'teams' else 'brawler'
+        bundle[view] = {str(bucket): columns(stats, key, index.__getitem__) for bucket, stats in sorted(buckets.items())}
+    return bundle
+
+def add_map_bundles(exporter: DataExporter, views: dict, extra: dict | None = None) -> dict:
+    # views maps a view to the {game_mode: {game_map: {bucket: stats}}} tree written as separate files. Every map
+    # also gets one bundle holding all of its views and buckets, listed in a manifest with content hashes so the
+    # bundles can be cached indefinitely under a ?v=<hash> URL
+    maps = defaultdict(lambda: defaultdict(dict))
+    for view, tree in views.items():
+        for game_mode, game_maps in tree.items():
+            if game_mode is None:
+                continue
+            for game_map, buckets in game_maps.items():
+                if game_map is None:
+                    continue
+                maps[(game_mode.lower(), game_map)][view].update((bucket, stats) for bucket, stats in buckets.items() if bucket is not None)
+
+    manifest = defaultdict(dict)
+    for (game_mode, game_map), map_views in sorted(maps.items()):
+        path = f"{game_mode}/{game_map}/{BUNDLE_FILE}"
+        digest = exporter.add(path, build_bundle(map_views))
+        manifest[game_mode][game_map] = {
+            'bundle': path,
+            'hash': digest[:16],
+            'buckets': {view: sorted(buckets) for view, buckets in map_views.items()}
+        }
+
+    # Other per-map files (e.g. matchups) are listed next to the bundle, as {(mode, map): {name: entry}}
+    for (game_mode, game_map), entries in (extra or {}).items():
+        manifest[game_mode].setdefault(game_map, {}).update(entries)
+
+    exporter.add(MANIFEST_FILE, {'modes': manifest})
+    return manifest
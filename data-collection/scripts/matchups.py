@@ -0,0 +1,172 @@
+import numpy as np
+from collections import defaultdict
+from typing import Iterator
+from database import DICTIONARY_TABLES
+from scripts.data_export import DataExporter
+
+MATCHUPS_FILE = 'matchups.json'
+
+# Kinds of pair counts kept per group, indexed as counts[slot, kind, brawler, other]
+COUNTER_GAMES, COUNTER_WINS, SYNERGY_GAMES, SYNERGY_WINS = range(4)
+KINDS = ['counter_games', 'counter_wins', 'synergy_games', 'synergy_wins']
+
+# The frontend's folder name for each game type's buckets
+VIEWS = {'ranked': 'trophies', 'soloRanked': 'ranked'}
+
+def battle_sides_query(bucket_families: dict[str, list[int]]) -> str:
+    # One row per battle with both teams' brawler ids, so every battle is counted once whoever was crawled.
+    # Battles are bucketed by their participants' average rank
+    levels = " ".join(f"WHEN '{game_type}' THEN width_bucket(AVG(p.rank)::int, array{buckets})" for game_type, buckets in bucket_families.items())
+    return f"""
+        SELECT
+            gt.name AS game_type,
+            b.mode_id,
+            b.map_id,
+            b.result,
+            CASE gt.name {levels} END AS level,
+            array_agg(p.brawler_id) FILTER (WHERE NOT p.side) AS side_0,
+            array_agg(p.brawler_id) FILTER (WHERE p.side) AS side_1
+        FROM battle b
+        JOIN game_type gt ON gt.id = b.type_id
+        JOIN battle_participant p ON p.battle_id = b.battle_id AND p.battle_time = b.battle_time
+        WHERE gt.name = ANY($1::text[]) AND b.map_id IS NOT NULL
+        GROUP BY b.battle_id, b.battle_time, gt.name, b.mode_id, b.map_id, b.result
+    """
+
+class MatchupAccumulator:
+
+    def __init__(self, brawler_count: int):
+        # Dense pair counts of shape (kind, brawler, other), one array per (game_type, mode_id, map_id, level) slot.
+        # Each slot is allocated once when it first appears, existing ones are never copied
+        self.brawler_count = brawler_count
+        self.counts: list[np.ndarray] = []
+        self.slots = {}
+
+    def slot(self, key: tuple) -> int:
+        if key not in self.slots:
+            self.slots[key] = len(self.counts)
+            self.counts.append(np.zeros((len(KINDS), self.brawler_count, self.brawler_count), dtype=np.uint32))
+        return self.slots[key]
+
+    def add_pairs(self, slots: np.ndarray, kind: int, first: np.ndarray, second: np.ndarray, mask: np.ndarray | None = None):
+        # first and second are (battles, pairs) brawler ids, counted into counts[slot, kind, first, second]
+        b = self.brawler_count
+        index = (((slots[:, None] * len(KINDS) + kind) * b + first) * b + second)
+        if mask is not None:
+            index = index[mask]
+        keys, counts = np.unique(index, return_counts=True)
+        if not len(keys):
+            return
+        # Keys are sorted, so each slot's keys are one contiguous run
+        size = len(KINDS) * b * b
+        key_slots = keys // size
+        bounds = np.flatnonzero(np.diff(key_slots)) + 1
+        for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(keys)]])):
+            flat = self.counts[key_slots[start]].reshape(-1)
+            flat[keys[start:end] % size] += counts[start:end].astype(np.uint32)
+
+    def add_battles(self, slots: np.ndarray, side_0: np.ndarray, side_1: np.ndarray, results: np.ndarray):
+        # side_0 and side_1 are (battles, team size) brawler ids, results are from side 0's perspective. Only decisive
+        # battles are counted, so games minus wins are losses and win rates center on 50%
+        decisive = results != 0
+        slots, side_0, side_1, results = slots[decisive], side_0[decisive], side_1[decisive], results[decisive]
+        size = side_0.shape[1]
+        across_i, across_j = (axis.ravel() for axis in np.meshgrid(np.arange(size), np.arange(size), indexing='ij'))
+        within = across_i != across_j
+        within_i, within_j = across_i[within], across_j[within]
+
+        for team, enemies, won in [(side_0, side_1, results == 1), (side_1, side_0, results == -1)]:
+            self.add_pairs(slots, COUNTER_GAMES, team[:, across_i], enemies[:, across_j])
+            self.add_pairs(slots, COUNTER_WINS, team[:, across_i], enemies[:, across_j], won)
+            self.add_pairs(slots, SYNERGY_GAMES, team[:, within_i], team[:, within_j])
+            self.add_pairs(slots, SYNERGY_WINS, team[:, within_i], team[:, within_j], won)
+
+    def add_rows(self, rows):
+        # Groups a chunk of battle rows by team size and adds each group with array operations
+        by_size = defaultdict(lambda: ([], [], [], []))
+        for row in rows:
+            side_0, side_1 = row['side_0'], row['side_1']
+            if not row['level'] or not side_0 or not side_1 or len(side_0) != len(side_1):
+                continue
+            slots, sides_0, sides_1, results = by_size[len(side_0)]
+            slots.append(self.slot((row['game_type'], row['mode_id'], row['map_id'], row['level'])))
+            sides_0.append(side_0)
+            sides_1.append(side_1)
+            results.append(row['result'])
+
+        for slots, sides_0, sides_1, results in by_size.values():
+            self.add_battles(np.array(slots, dtype=np.int64), np.array(sides_0, dtype=np.int64), np.array(sides_1, dtype=np.int64), np.array(results))
+
+    def cumulative(self, bucket_families: dict[str, list[int]]) -> Iterator[tuple[tuple, dict]]:
+        # Yields ((mode_id, map_id), {game_type: (buckets, array of (bucket, kind, brawler, other))}) with "rank >= bucket"
+        # totals, one map at a time. A map's counts are released as its totals are built, so only one map's arrays are
+        # alive beyond the counts still waiting. Consumes the accumulator
+        maps = defaultdict(lambda: defaultdict(dict))
+        for (game_type, mode_id, map_id, level), slot in self.slots.items():
+            maps[(mode_id, map_id)][game_type][level] = slot
+        self.slots = {}
+
+        for key, game_types in maps.items():
+            totals = {}
+            for game_type, slots in game_types.items():
+                buckets = bucket_families[game_type]
+                stacked = np.zeros((len(buckets), len(KINDS), self.brawler_count, self.brawler_count), dtype=np.uint64)
+                for level, slot in slots.items():
+                    stacked[level - 1] = self.counts[slot]
+                    self.counts[slot] = None
+                totals[game_type] = (buckets, np.cumsum(stacked[::-1], axis=0)[::-1])
+            yield key, totals
+        self.counts = []
+
+async def fetch_matchups(conn, trophy_buckets: list[int], rank_buckets: list[int], chunk_size: int = 20_000) -> tuple[MatchupAccumulator, dict, dict]:
+    # Streams every battle once through a server-side cursor and accumulates pair counts in dense arrays
+    families = {'ranked': trophy_buckets, 'soloRanked': rank_buckets}
+    async with conn.transaction(isolation='repeatable_read', readonly=True):
+        dictionaries = {
+            table: {row['id']: row['name'] for row in await conn.fetch(f"SELECT id, name FROM {table}")}
+            for table in DICTIONARY_TABLES
+        }
+        accumulator = MatchupAccumulator(max(dictionaries['brawler'], default=0) + 1)
+
+        cursor = await conn.cursor(battle_sides_query(families), list(families), prefetch=chunk_size)
+        while rows := await cursor.fetch(chunk_size):
+            accumulator.add_rows(rows)
+
+    return accumulator, families, dictionaries
+
+def sparse(matrix: np.ndarray) -> list[list[int]]:
+    # [brawler, other, count] for every non-zero cell
+    rows, columns = np.nonzero(matrix)
+    return np.stack([rows, columns, matrix[rows, columns]], axis=1).tolist()
+
+def dense(triples: list, n: int) -> np.ndarray:
+    matrix = np.zeros((n, n), dtype=np.float64)
+    if triples:
+        rows, columns, counts = np.array(triples, dtype=np.int64).T
+        matrix[rows, columns] = counts
+    return matrix
+
+def matchup_payload(views: dict, brawler_names: dict) -> dict:
+    # views maps a view to (buckets, cumulative counts). Only brawlers seen on the map are kept and indexed by their
+    # position in 'brawlers', and every matrix is sparse: [brawler, other, count] for the brawler's games or wins
+    # against/with the other, pairs never seen are left out. Buckets without games are left out
+    present = np.flatnonzero(sum(counts[0, COUNTER_GAMES].sum(axis=1) for _, counts in views.values()))
+    payload = {'brawlers': [brawler_names.get(int(brawler_id)) for brawler_id in present]}
+    for view, (buckets, counts) in views.items():
+        matrices = counts[:, :, present][:, :, :, present]
+        payload[view] = {
+            str(bucket): {kind: sparse(matrices[i, k]) for k, kind in enumerate(KINDS)}
+            for i, bucket in enumerate(buckets)
+            if matrices[i, COUNTER_GAMES].any()
+        }
+    return payload
+
+def add_matchup_files(exporter: DataExporter, accumulator: MatchupAccumulator, families: dict, dictionaries: dict) -> Iterator[tuple[tuple, dict, dict]]:
+    # Writes {mode}/{map}/matchups.json one map at a time, yielding ((mode, map), manifest entry, payload) for each
+    for (mode_id, map_id), totals in accumulator.cumulative(families):
+        game_mode, game_map = dictionaries['game_mode'].get(mode_id), dictionaries['game_map'].get(map_id)
+        if game_mode is None or game_map is None:
+            continue
+        path = f"{game_mode.lower()}/{game_map}/{MATCHUPS_FILE}"
+        payload = matchup_payload({VIEWS[game_type]: views for game_type, views in totals.items()}, dictionaries['brawler'])
+        yield (game_mode.lower(), game_map), {'path': path, 'hash': exporter.add(path, payload)[:16]}, payload
@@ -0,0 +1,153 @@
+import asyncio
+import asyncpg
+import os
+from datetime import datetime, timedelta
+from database import SCHEMA, create_partitions, rebuild_rollups
+
+BATTLE_KEY = "('x' || substr(md5(l.battle_id), 1, 16))::bit(64)::bigint"
+BATTLE_TIME = """TO_TIMESTAMP(l.battle_time, 'YYYYMMDD"T"HH24MISS.MS"Z"')"""
+
+# Legacy battle ids are the 20 character battle time followed by the lowest player tag, which marks side 0
+IS_SIDE_0 = "(l.team_ids::jsonb ? substr(l.battle_id, 21))"
+
+async def migrate_day(conn, day: datetime):
+    start, end = day.strftime('%Y%m%d'), (day + timedelta(days=1)).strftime('%Y%m%d')
+
+    await create_partitions(conn, [day.date()])
+
+    async with conn.transaction():
+        # Legacy battle times are UTC strings
+        await conn.execute("SET LOCAL TIME ZONE 'UTC'")
+
+        # One legacy row per battle is enough, the team arrays hold every participant
+        # (CREATE TABLE AS can't take bind parameters, the bounds are formatted dates)
+        await conn.execute(f"""
+            CREATE TEMP TABLE legacy_chunk ON COMMIT DROP AS
+            SELECT DISTINCT ON (battle_id) *
+            FROM battles
+            WHERE battle_id >= '{start}' AND battle_id < '{end}'
+            ORDER BY battle_id
+        """)
+
+        for table, names in [
+            ('game_mode', "SELECT game_mode FROM legacy_chunk"),
+            ('game_map', "SELECT game_map FROM legacy_chunk"),
+            ('game_type', "SELECT game_type FROM legacy_chunk"),
+            ('brawler', "SELECT jsonb_array_elements_text(team::jsonb) FROM legacy_chunk UNION SELECT jsonb_array_elements_text(opponents::jsonb) FROM legacy_chunk")
+        ]:
+            await conn.execute(f"""
+                INSERT INTO {table} (name)
+                SELECT DISTINCT n.name FROM ({names}) AS n(name)
+                WHERE n.name IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {table} d WHERE d.name = n.name)
+                ON CONFLICT (name) DO NOTHING
+            """)
+
+        battles = await conn.execute(f"""
+            INSERT INTO battle (battle_id, battle_time, mode_id, map_id, type_id, result)
+            SELECT
+                {BATTLE_KEY},
+                {BATTLE_TIME},
+                gm.id,
+                mp.id,
+                gt.id,
+                CASE l.result WHEN 'victory' THEN 1 WHEN 'defeat' THEN -1 ELSE 0 END * CASE WHEN {IS_SIDE_0} THEN 1 ELSE -1 END
+            FROM legacy_chunk l
+            JOIN game_mode gm ON gm.name = l.game_mode
+            LEFT JOIN game_map mp ON mp.name = l.game_map
+            JOIN game_type gt ON gt.name = l.game_type
+            ON CONFLICT (battle_id, battle_time) DO NOTHING
+        """)
+
+        participants = await conn.execute(f"""
+            INSERT INTO battle_participant (battle_id, battle_time, player_id, side, brawler_id, power, rank)
+            SELECT p.battle_id, p.battle_time, p.player_id, p.side, b.id, p.power::smallint, p.rank::smallint
+            FROM (
+                SELECT {BATTLE_KEY} AS battle_id, {BATTLE_TIME} AS battle_time, t.player_id, NOT {IS_SIDE_0} AS side, t.brawler, t.power, t.rank
+                FROM legacy_chunk l, ROWS FROM (
+                    jsonb_array_elements_text(l.team_ids::jsonb),
+                    jsonb_array_elements_text(l.team::jsonb),
+                    jsonb_array_elements_text(l.team_power::jsonb),
+                    jsonb_array_elements_text(l.team_rank::jsonb)
+                ) AS t(player_id, brawler, power, rank)
+                UNION ALL
+                SELECT {BATTLE_KEY}, {BATTLE_TIME}, t.player_id, {IS_SIDE_0}, t.brawler, t.power, t.rank
+                FROM legacy_chunk l, ROWS FROM (
+                    jsonb_array_elements_text(l.opponents_ids::jsonb),
+                    jsonb_array_elements_text(l.opponents::jsonb),
+                    jsonb_array_elements_text(l.opponents_power::jsonb),
+                    jsonb_array_elements_text(l.opponents_rank::jsonb)
+                ) AS t(player_id, brawler, power, rank)
+            ) p
+            JOIN brawler b ON b.name = p.brawler
+            ON CONFLICT (battle_id, player_id, battle_time) DO NOTHING
+        """)
+
+    return int(battles.split()[2]), int(participants.split()[2])
+
+async def migrate_schema():
+    print("\nChecking environment variables...")
+
+    for var in ['POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD']:
+        if not os.getenv(var):
+            raise EnvironmentError(f"❌ {var} not set")
+
+    print("\nTrying to connect to database...")
+
+    try:
+        conn = await asyncpg.connect(
+            user=os.getenv('POSTGRES_USER'),
+            password=os.getenv('POSTGRES_PASSWORD'),
+            database=os.getenv('POSTGRES_DB'),
+            host=os.getenv('POSTGRES_HOST'),
+            port=os.getenv('POSTGRES_PORT'),
+            timeout=float(os.getenv('POSTGRES_TIMEOUT', 30))
+        )
+    except Exception as e:
+        print(f"\n❌ Error connecting to the database: {e}")
+        return
+
+    try:
+        if not await conn.fetchval("SELECT to_regclass('battles')"):
+            print("\n✅ No legacy battles table found, nothing to migrate")
+            return
+
+        first_id, last_id = await conn.fetchrow("SELECT MIN(battle_id), MAX(battle_id) FROM battles")
+        if first_id is None:
+            print("\n✅ Legacy battles table is empty, nothing to migrate")
+            return
+
+        first_day = datetime.strptime(first_id[:8], '%Y%m%d')
+        last_day = datetime.strptime(last_id[:8], '%Y%m%d')
+
+        confirmation = input(f"\n⚠️ This will copy legacy battles from {first_day.date()} to {last_day.date()} into the normalized schema. Proceed? (y/N): ")
+
+        if confirmation.lower() != 'y':
+            print("\n❌ Operation cancelled by user")
+            return
+
+        for statement in SCHEMA:
+            await conn.execute(statement)
+
+        # One transaction per day keeps locks short, and ON CONFLICT makes re-running after an interruption safe
+        day = first_day
+        while day <= last_day:
+            battles, participants = await migrate_day(conn, day)
+            print(f"✅ Migrated {day.date()}: {battles} battles, {participants} participants")
+            day += timedelta(days=1)
+
+        print("\nRebuilding rollups...")
+        await rebuild_rollups(conn)
+
+        confirmation = input("\n⚠️ Migration finished. Drop the legacy battles table? (y/N): ")
+
+        if confirmation.lower() == 'y':
+            await conn.execute("DROP TABLE battles")
+            await conn.execute("DROP TABLE IF EXISTS battles_staging")
+            print("\n✅ Dropped the legacy battles table")
+    except Exception as e:
+        print(f"\n❌ Unexpected error: {str(e)}")
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_schema())
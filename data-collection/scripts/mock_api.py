@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import json
+import random
+from collections import Counter
+from datetime import datetime, timezone
+from aiohttp import web
+from scripts.synthetic_data import PlayerGraph
+
+def create_app(graph: PlayerGraph, latency: float = 0.05, jitter: float = 0.02, throttle_rate: float = 0.0, retry_after: float = 1, seed: int = 0) -> web.Application:
+    # Serves the two endpoints the crawler uses from a synthetic player graph, with simulated latency and 429s.
+    # GET /stats reports how many responses of each kind were served
+    rng = random.Random(seed)
+    stats = Counter()
+
+    async def respond(kind: str, body) -> web.Response:
+        await asyncio.sleep(max(0, rng.gauss(latency, jitter)))
+        if rng.random() < throttle_rate:
+            stats["throttled"] += 1
+            return web.json_response({"reason": "requestThrottled"}, status=429, headers={"Retry-After": str(retry_after)})
+        if body is None:
+            stats["not_found"] += 1
+            return web.json_response({"reason": "notFound"}, status=404)
+        stats[kind] += 1
+        return web.Response(body=json.dumps({"items": body}).encode(), content_type="application/json")
+
+    async def rankings(request: web.Request) -> web.Response:
+        return await respond("rankings", graph.top_players())
+
+    async def battlelog(request: web.Request) -> web.Response:
+        return await respond("battlelogs", graph.battlelog(request.match_info["tag"], datetime.now(timezone.utc)))
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_get("/v1/rankings/global/players", rankings)
+    app.router.add_get("/v1/players/{tag}/battlelog", battlelog)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--players', type=int, default=20_000, help='Players in the synthetic graph')
+    parser.add_argument('--battles-per-player', type=float, default=40, help='Battles per player over the history and test window')
+    parser.add_argument('--history-hours', type=float, default=12, help='Hours of battles that already happened when the server starts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.05, help='Mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Standard deviation of the latency in seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After seconds sent with 429s')
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument('--duration-hours', type=float, default=1, help='Hours of battles that happen while the server runs')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    print(f"\nGenerating {args.players:,} players...")
+    graph = PlayerGraph(args.players, battles_per_player=args.battles_per_player, history_hours=args.history_hours, duration_hours=args.duration_hours, seed=args.seed)
+    print(f"Generated {len(graph.battles):,} battles, serving on http://127.0.0.1:{args.port}/v1")
+    web.run_app(create_app(graph, args.latency, args.jitter, args.throttle_rate, args.retry_after, args.seed), host="127.0.0.1", port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
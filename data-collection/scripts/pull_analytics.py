@@ -1,98 +1,90 @@
+import argparse
 import asyncio
 import asyncpg
 import os
-import json
 from collections import defaultdict
+from database import rebuild_rollups
+from scripts.analytics_engine import fetch_all_stats
+from scripts.data_export import DataExporter
+from scripts.map_bundles import add_map_bundles
+from scripts.matchups import add_matchup_files, fetch_matchups
+from scripts.recommend import add_draft_file
+from scripts.scoring import TEAM_FETCH_MIN_GAMES, TEAM_OBSERVATIONS_PER_GAME, group_totals, score_records
 
 TROPHY_BUCKETS = [700, 800, 900, 1000] # Trophy buckets: 700+, 800+, 900+, 1000+
 RANK_BUCKETS = list(range(10, 20))  # 10-19 for Power League ranks
 
-async def fetch_trophy_stats(conn):
-    trophy_query = f"""
-        WITH bucketed_battles AS (
-            SELECT
-                game_mode,
-                game_map,
-                brawler,
-                result,
-                rank,
-                unnest(array{TROPHY_BUCKETS}) AS bucket
-            FROM battles
-            WHERE
-                game_type = 'ranked' AND
-                rank >= ANY(array{TROPHY_BUCKETS})
-        )
+def rollup_stats_query(rollup: str, key: str, game_type: str, buckets: list[int], min_games: int = 0) -> str:
+    # Bucketed stats are suffix sums over the per-rank rollup ("rank >= bucket"), never a scan of the battle tables
+    return f"""
         SELECT
-            game_mode,
-            game_map,
+            r.mode_id,
+            r.map_id,
             bucket,
-            brawler,
-            COUNT(*) AS games_played,
-            SUM(CASE WHEN result = 'victory' THEN 1 ELSE 0 END) AS victories
-        FROM bucketed_battles
-        WHERE rank >= bucket
-        GROUP BY game_mode, game_map, bucket, brawler
+            r.{key},
+            SUM(r.games)::bigint AS games_played,
+            SUM(r.victories)::bigint AS victories
+        FROM {rollup} r, unnest(array{buckets}) AS bucket
+        WHERE
+            r.type_id = (SELECT id FROM game_type WHERE name = '{game_type}') AND
+            r.rank >= bucket
+        GROUP BY r.mode_id, r.map_id, bucket, r.{key}
+        HAVING SUM(r.games) >= {min_games}
+    """
+
+async def fetch_trophy_stats(conn):
+    trophy_query = f"""
+        SELECT gm.name AS game_mode, mp.name AS game_map, s.bucket, br.name AS brawler, s.games_played, s.victories
+        FROM ({rollup_stats_query('brawler_rollup', 'brawler_id', 'ranked', TROPHY_BUCKETS)}) s
+        JOIN game_mode gm ON gm.id = s.mode_id
+        LEFT JOIN game_map mp ON mp.id = s.map_id
+        JOIN brawler br ON br.id = s.brawler_id
     """
     return await conn.fetch(trophy_query)
 
 async def fetch_power_league_stats(conn):
     power_league_query = f"""
-        WITH bucketed_battles AS (
-            SELECT
-                game_mode,
-                game_map,
-                brawler,
-                result,
-                rank,
-                unnest(array{RANK_BUCKETS}) AS bucket
-            FROM battles
-            WHERE
-                game_type = 'soloRanked' AND
-                rank >= ANY(array{RANK_BUCKETS})
-        )
-        SELECT
-            game_mode,
-            game_map,
-            bucket,
-            brawler,
-            COUNT(*) AS games_played,
-            SUM(CASE WHEN result = 'victory' THEN 1 ELSE 0 END) AS victories
-        FROM bucketed_battles
-        WHERE rank >= bucket
-        GROUP BY game_mode, game_map, bucket, brawler
+        SELECT gm.name AS game_mode, mp.name AS game_map, s.bucket, br.name AS brawler, s.games_played, s.victories
+        FROM ({rollup_stats_query('brawler_rollup', 'brawler_id', 'soloRanked', RANK_BUCKETS)}) s
+        JOIN game_mode gm ON gm.id = s.mode_id
+        LEFT JOIN game_map mp ON mp.id = s.map_id
+        JOIN brawler br ON br.id = s.brawler_id
     """
     return await conn.fetch(power_league_query)
 
 async def fetch_team_stats(conn):
     team_query = f"""
-        WITH bucketed_battles AS (
-            SELECT
-                game_mode,
-                game_map,
-                team,
-                result,
-                rank,
-                unnest(array{TROPHY_BUCKETS}) AS bucket
-            FROM battles
-            WHERE
-                game_type = 'ranked' AND
-                rank >= ANY(array{TROPHY_BUCKETS})
-        )
         SELECT
-            game_mode,
-            game_map,
-            bucket,
-            team,
-            COUNT(*) AS games_played,
-            SUM(CASE WHEN result = 'victory' THEN 1 ELSE 0 END) AS victories
-        FROM bucketed_battles
-        WHERE rank >= bucket
-        GROUP BY game_mode, game_map, bucket, team
-        HAVING COUNT(*) >= 300
+            gm.name AS game_mode,
+            mp.name AS game_map,
+            s.bucket,
+            ARRAY(
+                SELECT br.name
+                FROM unnest(s.team) AS t(brawler_id)
+                JOIN brawler br ON br.id = t.brawler_id
+                ORDER BY br.name COLLATE "C"
+            ) AS team,
+            s.games_played,
+            s.victories
+        FROM ({rollup_stats_query('team_rollup', 'team', 'ranked', TROPHY_BUCKETS, min_games=TEAM_FETCH_MIN_GAMES)}) s
+        JOIN game_mode gm ON gm.id = s.mode_id
+        LEFT JOIN game_map mp ON mp.id = s.map_id
     """
     return await conn.fetch(team_query)
 
-async def main():
+async def connect():
+    return await asyncpg.connect(
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        database=os.getenv('POSTGRES_DB'),
+        host=os.getenv('POSTGRES_HOST'),
+        port=os.getenv('POSTGRES_PORT'),
+        timeout=float(os.getenv('POSTGRES_TIMEOUT', 30))
+    )
+
+async def main(rebuild: bool = False, engine: str = 'single-pass', parallel: int = 0, exporter: DataExporter | None = None, method: str = 'wilson', matchups: bool = False):
+    exporter = exporter or DataExporter()
+
     # Check environment variables
     print("\nChecking environment variables...")
 
@@ -104,36 +96,41 @@ async def main():
     print("\nTrying to connect to the database...")
     
     try:
-        conn = await asyncpg.connect(
-            user=os.getenv('POSTGRES_USER'),
-            password=os.getenv('POSTGRES_PASSWORD'),
-            database=os.getenv('POSTGRES_DB'),
-            host=os.getenv('POSTGRES_HOST'),
-            port=os.getenv('POSTGRES_PORT'),
-            timeout=float(os.getenv('POSTGRES_TIMEOUT', 30))
-        )
+        conn = await connect()
     except Exception as e:
         print(f"\n❌ Error connecting to the database: {e}")
         return
 
     try:
         print("\nConnection successful.")
+
+        if rebuild:
+            print("\nRebuilding rollups from the battle tables...")
+            await rebuild_rollups(conn)
         print("\nExecuting queries...")
         
-        trophy_records = await fetch_trophy_stats(conn)
-        power_league_records = await fetch_power_league_stats(conn)
-        team_records = await fetch_team_stats(conn)
+        if engine == 'single-pass':
+            # One scan per rollup and one snapshot for every bucket family
+            trophy_records, power_league_records, team_records = await fetch_all_stats(conn, TROPHY_BUCKETS, RANK_BUCKETS, connect, parallel)
+        else:
+            trophy_records = await fetch_trophy_stats(conn)
+            power_league_records = await fetch_power_league_stats(conn)
+            team_records = await fetch_team_stats(conn)
 
         # Process trophy records
-        process_brawler_records(trophy_records, 'trophies')
+        data_trophies = process_brawler_records(trophy_records, 'trophies', exporter, method)
 
         # Process Power League records
-        process_brawler_records(power_league_records, 'ranked')
+        data_ranked = process_brawler_records(power_league_records, 'ranked', exporter, method)
 
-        # Process team records
+        # Process team records, keeping the teams with enough games for their map's volume. The team records only
+        # hold teams above the fetch minimum, the map's volume comes from the unfiltered trophy brawler totals
         data_teams = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+        team_scores, team_keep = score_records(team_records, method, TEAM_OBSERVATIONS_PER_GAME, group_totals(trophy_records))
         
-        for record in team_records:
+        for record, score, keep in zip(team_records, team_scores, team_keep):
+            if not keep:
+                continue
             game_mode = record['game_mode'].lower()
             game_map = record['game_map']
             bucket = record['bucket']
@@ -142,10 +139,13 @@ async def main():
             victories = record['victories']
             win_rate = victories / games_played if games_played > 0 else 0
 
+            # Exported in games like the brawler stats, the rollup counts each game once per team member. Members
+            # below the bucket aren't counted, so the division isn't always exact
             data_teams[game_mode][game_map][bucket].append({
-                'team': json.loads(team),
-                'games_played': games_played,
-                'win_rate': win_rate
+                'team': list(team),
+                'games_played': round(games_played / TEAM_OBSERVATIONS_PER_GAME),
+                'win_rate': win_rate,
+                'score': round(float(score), 5)
             })
 
         # Modified team data writing
@@ -159,28 +159,39 @@ async def main():
                     if bucket is None:
                         continue
 
-                    # Sort team stats by win rate descending
-                    team_stats.sort(key=lambda x: x['win_rate'], reverse=True)
+                    # Sort team stats by score descending
+                    team_stats.sort(key=lambda x: x['score'], reverse=True)
+
+                    # Trophy bucket in filename
+                    exporter.add(os.path.join(str(game_mode), str(game_map), 'trophies', f'team-{bucket}-trophies.json'), team_stats)
 
-                    directory = os.path.join('data', str(game_mode), str(game_map), 'trophies')
-                    os.makedirs(directory, exist_ok=True)
+        # Counter and synergy matrices need a pass over every battle, so they are opt-in
+        extra = {}
+        if matchups:
+            print("\nComputing matchups from the battle tables...")
+            accumulator, families, dictionaries = await fetch_matchups(conn, TROPHY_BUCKETS, RANK_BUCKETS)
+            # Matchups are written one map at a time, with the map's draft table right after it, so only one map's
+            # matrices are in memory at once
+            for (game_mode, game_map), entry, payload in add_matchup_files(exporter, accumulator, families, dictionaries):
+                extra[(game_mode, game_map)] = {'matchups': entry, 'draft': add_draft_file(exporter, game_mode, game_map, payload)}
 
-                    # Write to JSON file with trophy bucket in filename
-                    file_path = os.path.join(directory, f'team-{bucket}-trophies.json')
-                    with open(file_path, 'w') as f:
-                        json.dump(team_stats, f, indent=4)
+        # One bundle per map with every view and bucket, plus the manifest listing them
+        add_map_bundles(exporter, {'trophies': data_trophies, 'ranked': data_ranked, 'teams': data_teams}, extra)
 
-                    print(f"✅ Written team data to {file_path}")
+        print(f"\nExporting {len(exporter.files)} files to {exporter.root}...")
+        written, unchanged = exporter.commit()
+        print(f"\n✅ Exported {written} updated and {unchanged} unchanged files")
 
     except Exception as e:
         print(f"\n❌ Error: {e}")
     finally:
         await conn.close()
 
-def process_brawler_records(records, mode_type):
+def process_brawler_records(records, mode_type, exporter: DataExporter, method: str = 'wilson'):
     data = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    brawler_scores, _ = score_records(records, method)
     
-    for record in records:
+    for record, score in zip(records, brawler_scores):
         game_mode = record['game_mode']
         game_map = record['game_map']
         bucket = record['bucket']
@@ -191,8 +202,9 @@ def process_brawler_records(records, mode_type):
 
         data[game_mode][game_map][bucket].append({
             'brawler': brawler,
-            'games_played': games_played // 3,
-            'win_rate': win_rate
+            'games_played': games_played,
+            'win_rate': win_rate,
+            'score': round(float(score), 5)
         })
 
     for game_mode, maps in data.items():
@@ -205,18 +217,23 @@ def process_brawler_records(records, mode_type):
                 if bucket is None:
                     continue
 
-                brawler_stats.sort(key=lambda x: x['win_rate'], reverse=True)
+                brawler_stats.sort(key=lambda x: x['score'], reverse=True)
                 
-                directory = os.path.join('data', str(game_mode), str(game_map), mode_type)
-                os.makedirs(directory, exist_ok=True)
-
                 suffix = 'rank' if mode_type == 'ranked' else 'trophies'
-                file_path = os.path.join(directory, f'brawler-{bucket}-{suffix}.json')
-                
-                with open(file_path, 'w') as f:
-                    json.dump(brawler_stats, f, indent=4)
+                exporter.add(os.path.join(str(game_mode), str(game_map), mode_type, f'brawler-{bucket}-{suffix}.json'), brawler_stats)
 
-                print(f"✅ Written data to {file_path}")
+    return data
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Recompute the rollup tables from scratch before exporting')
+    parser.add_argument('--engine', choices=['single-pass', 'queries'], default='single-pass', help='single-pass reads each rollup once for all buckets, queries runs one query per bucket family')
+    parser.add_argument('--parallel', type=int, default=0, help='Extra connections for the single-pass engine, splitting the work by game mode')
+    parser.add_argument('--output', default='data', help='Export directory, replaced atomically once every file is written')
+    parser.add_argument('--export-workers', type=int, default=8, help='Threads encoding, compressing and writing export files')
+    parser.add_argument('--compress', nargs='*', choices=['gz', 'br'], default=[], help='Also write precompressed .json.gz and/or .json.br siblings')
+    parser.add_argument('--score', choices=['wilson', 'bayes'], default='wilson', help='Rank by the Wilson lower bound of the win rate or by the win rate shrunk towards the map average')
+    parser.add_argument('--matchups', action='store_true', help='Also export per-map counter and synergy matrices and draft lookup tables, computed from every battle')
+    args = parser.parse_args()
+    exporter = DataExporter(args.output, args.export_workers, args.compress)
+    asyncio.run(main(args.rebuild_rollups, args.engine, args.parallel, exporter, args.score, args.matchups))
\ No newline at end of file
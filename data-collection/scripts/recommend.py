@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from scripts.data_export import DataExporter
+from scripts.matchups import KINDS, dense
+
+DRAFT_FILE = 'draft.json'
+
+PRIOR_GAMES = 50 # Pseudo-games pulling every rate towards its expectation, so rare pairs score close to 0
+
+def logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return np.log(p / (1 - p))
+
+class DraftTable:
+
+    def __init__(self, brawlers: list[str], counter_games, counter_wins, synergy_games, synergy_wins, prior_games: float = PRIOR_GAMES):
+        # Every score is a log-odds advantage: solo over an even game, synergy and counter over what the
+        # brawlers' solo strengths already predict. A pick's score is its solo score plus its synergy with
+        # each ally plus its counter score against each enemy
+        self.brawlers = brawlers
+        self.index = {brawler: i for i, brawler in enumerate(brawlers)}
+
+        games = counter_games.sum(axis=1)
+        solo_rate = (counter_wins.sum(axis=1) + 0.5 * prior_games) / (games + prior_games)
+        self.solo = logit(solo_rate)
+
+        expected_counter = 1 / (1 + np.exp(-(self.solo[:, None] - self.solo[None, :])))
+        counter_rate = (counter_wins + expected_counter * prior_games) / (counter_games + prior_games)
+        self.counter = logit(counter_rate) - logit(expected_counter)
+
+        expected_synergy = 1 / (1 + np.exp(-(self.solo[:, None] + self.solo[None, :])))
+        synergy_rate = (synergy_wins + expected_synergy * prior_games) / (synergy_games + prior_games)
+        self.synergy = logit(synergy_rate) - logit(expected_synergy)
+
+        np.fill_diagonal(self.synergy, 0)
+
+    def recommend(self, allies: list[str] = (), enemies: list[str] = (), limit: int = 10) -> list[dict]:
+        ally_ids = [self.index[brawler] for brawler in allies if brawler in self.index]
+        enemy_ids = [self.index[brawler] for brawler in enemies if brawler in self.index]
+
+        synergy = self.synergy[:, ally_ids].sum(axis=1)
+        counter = self.counter[:, enemy_ids].sum(axis=1)
+        total = self.solo + synergy + counter
+        # Picked brawlers can't be picked again by the same team, and never rank
+        total[ally_ids] = -np.inf
+        total[enemy_ids] = -np.inf
+
+        best = np.argsort(-total)[:limit]
+        return [
+            {
+                'brawler': self.brawlers[i],
+                'score': round(float(total[i]), 4),
+                'solo': round(float(self.solo[i]), 4),
+                'synergy': round(float(synergy[i]), 4),
+                'counter': round(float(counter[i]), 4)
+            }
+            for i in best if np.isfinite(total[i])
+        ]
+
+    def lookup(self) -> dict:
+        # Static form of the table for the frontend: the same sums can be done client-side
+        return {
+            'brawlers': self.brawlers,
+            'solo': np.round(self.solo, 4).tolist(),
+            'synergy': np.round(self.synergy, 4).ravel().tolist(),
+            'counter': np.round(self.counter, 4).ravel().tolist()
+        }
+
+def draft_tables(matchups: dict) -> dict:
+    # {(view, bucket): DraftTable} from a matchups.json payload
+    n = len(matchups['brawlers'])
+    return {
+        (view, int(bucket)): DraftTable(matchups['brawlers'], *(dense(matrices[kind], n) for kind in KINDS))
+        for view, buckets in matchups.items() if view != 'brawlers'
+        for bucket, matrices in buckets.items()
+    }
+
+def add_draft_file(exporter: DataExporter, game_mode: str, game_map: str, matchups: dict) -> dict:
+    # Writes {mode}/{map}/draft.json with a lookup table per view and bucket from the map's matchups payload, and
+    # returns its manifest entry
+    views = {}
+    for (view, bucket), table in draft_tables(matchups).items():
+        views.setdefault(view, {})[str(bucket)] = table.lookup()
+    path = f"{game_mode}/{game_map}/{DRAFT_FILE}"
+    return {'path': path, 'hash': exporter.add(path, views)[:16]}
+
+class DraftIndex:
+
+    def __init__(self):
+        # {(game_mode, game_map, view, bucket): DraftTable}
+        self.tables = {}
+
+    @classmethod
+    def load(cls, root: str = 'data') -> 'DraftIndex':
+        # Built from the exported matchups files listed in the manifest, so it needs no database connection
+        index = cls()
+        with open(os.path.join(root, 'manifest.json')) as f:
+            manifest = json.load(f)
+
+        for game_mode, maps in manifest['modes'].items():
+            for game_map, entry in maps.items():
+                if 'matchups' not in entry:
+                    continue
+                with open(os.path.join(root, entry['matchups']['path'])) as f:
+                    matchups = json.load(f)
+                for (view, bucket), table in draft_tables(matchups).items():
+                    index.tables[(game_mode, game_map, view, bucket)] = table
+        return index
+
+    def recommend(self, game_mode: str, game_map: str, view: str, bucket: int, allies: list[str] = (), enemies: list[str] = (), limit: int = 10) -> list[dict]:
+        table = self.tables.get((game_mode.lower(), game_map, view, bucket))
+        if table is None:
+            raise KeyError(f"No matchup data for {game_mode}/{game_map} ({view} {bucket})")
+        return table.recommend(allies, enemies, limit)
+
+def serve(index: DraftIndex, host: str, port: int):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            # /recommend?mode=gemgrab&map=Hard Rock Mine&view=trophies&bucket=700&allies=Poco&enemies=Colt,Brock
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                if url.path != '/recommend':
+                    raise KeyError(f"Unknown path {url.path}")
+                picks = index.recommend(
+                    query['mode'],
+                    query['map'],
+                    query.get('view', 'trophies'),
+                    int(query.get('bucket', 700)),
+                    [brawler for brawler in query.get('allies', '').split(',') if brawler],
+                    [brawler for brawler in query.get('enemies', '').split(',') if brawler],
+                    int(query.get('limit', 10))
+                )
+                status, body = 200, picks
+            except (KeyError, ValueError) as e:
+                status, body = 404, {'error': str(e)}
+
+            data = json.dumps(body, separators=(',', ':')).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"\n✅ Serving recommendations on http://{host}:{port}/recommend")
+    ThreadingHTTPServer((host, port), Handler).serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data', help='Export directory written by pull_analytics --matchups')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='Serve /recommend on this port')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--mode', help='Game mode for a one-off recommendation')
+    parser.add_argument('--map', help='Map for a one-off recommendation')
+    parser.add_argument('--view', choices=['trophies', 'ranked'], default='trophies')
+    parser.add_argument('--bucket', type=int, default=700)
+    parser.add_argument('--allies', default='', help='Comma-separated brawlers already picked by your team')
+    parser.add_argument('--enemies', default='', help='Comma-separated brawlers already picked by the enemy team')
+    args = parser.parse_args()
+
+    print(f"\nLoading matchups from {args.data}...")
+    index = DraftIndex.load(args.data)
+    print(f"\nLoaded {len(index.tables)} draft tables")
+
+    if args.mode and args.map:
+        picks = index.recommend(args.mode, args.map, args.view, args.bucket, [b for b in args.allies.split(',') if b], [b for b in args.enemies.split(',') if b])
+        for pick in picks:
+            print(f"{pick['brawler']:<16} {pick['score']:+.3f} (solo {pick['solo']:+.3f}, synergy {pick['synergy']:+.3f}, counter {pick['counter']:+.3f})")
+    if args.serve:
+        serve(index, args.host, args.serve)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+
+WILSON_Z = 1.96 # 95% confidence
+PRIOR_GAMES = 100 # Pseudo-games of the group's average win rate added by Bayesian shrinkage
+
+# Team rollups count a team's game once per member, so three observations make one game
+TEAM_OBSERVATIONS_PER_GAME = 3
+
+# Per map and bucket, teams need this share of the map's team games to be exported, within the floor and cap
+TEAM_MIN_SHARE = 0.001
+TEAM_MIN_FLOOR = 50
+TEAM_MIN_CAP = 2000
+
+# Teams below the floor can never be exported, so queries don't fetch them (in rollup observations)
+TEAM_FETCH_MIN_GAMES = TEAM_MIN_FLOOR * TEAM_OBSERVATIONS_PER_GAME
+
+def group_ids(keys: list) -> np.ndarray:
+    # Dense integer id per distinct key, e.g. per (game_mode, game_map, bucket)
+    ids = {}
+    return np.fromiter((ids.setdefault(key, len(ids)) for key in keys), dtype=np.int64, count=len(keys))
+
+def wilson_lower_bound(victories: np.ndarray, games: np.ndarray, z: float = WILSON_Z) -> np.ndarray:
+    n = np.maximum(games, 1e-9)
+    p = victories / n
+    z2 = z * z
+    centre = p + z2 / (2 * n)
+    margin = z * np.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+    return np.where(games > 0, (centre - margin) / (1 + z2 / n), 0.0)
+
+def bayesian_win_rate(victories: np.ndarray, games: np.ndarray, groups: np.ndarray, prior_games: float = PRIOR_GAMES) -> np.ndarray:
+    # Shrinks every win rate towards its group's pooled win rate, by prior_games games worth of it
+    group_victories = np.bincount(groups, weights=victories)
+    group_games = np.bincount(groups, weights=games)
+    prior = np.divide(group_victories, group_games, out=np.full_like(group_games, 0.5), where=group_games > 0)[groups]
+    return (victories + prior * prior_games) / (games + prior_games)
+
+def scores(victories: np.ndarray, games: np.ndarray, groups: np.ndarray, method: str = 'wilson') -> np.ndarray:
+    if method == 'wilson':
+        return wilson_lower_bound(victories, games)
+    if method == 'bayes':
+        return bayesian_win_rate(victories, games, groups)
+    raise ValueError(f"Unknown scoring method '{method}'")
+
+def group_key(record) -> tuple:
+    return record['game_mode'], record['game_map'], record['bucket']
+
+def group_totals(records: list) -> dict:
+    # Total games per (game_mode, game_map, bucket) over unfiltered records, e.g. the brawler stats. Both rollups
+    # count every participant once, so these are also the team rollup's totals (in observations)
+    totals = {}
+    for record in records:
+        totals[group_key(record)] = totals.get(group_key(record), 0) + record['games_played']
+    return totals
+
+def adaptive_min_games(group_games: np.ndarray, share: float = TEAM_MIN_SHARE, floor: int = TEAM_MIN_FLOOR, cap: int = TEAM_MIN_CAP) -> np.ndarray:
+    # Minimum games for each row from the total games of its group, so busy maps need more and quiet maps fewer
+    return np.clip(group_games * share, floor, cap)
+
+def score_records(records: list, method: str = 'wilson', observations_per_game: int = 1, totals: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+    # Scores for records with game_mode, game_map, bucket, games_played and victories, plus a mask of those that
+    # reach their group's adaptive minimum given the groups' total games (all of them without totals). Totals must
+    # come from the whole rollup, records fetched above a minimum would understate them
+    keys = [group_key(record) for record in records]
+    games = np.fromiter((record['games_played'] for record in records), dtype=np.float64, count=len(records))
+    victories = np.fromiter((record['victories'] for record in records), dtype=np.float64, count=len(records))
+    groups = group_ids(keys)
+
+    games /= observations_per_game
+    victories /= observations_per_game
+
+    keep = np.ones(len(records), dtype=bool)
+    if totals is not None:
+        group_games = np.fromiter((totals.get(key, 0) for key in keys), dtype=np.float64, count=len(records)) / observations_per_game
+        keep = games >= adaptive_min_games(group_games)
+    return scores(victories, games, groups, method), keep
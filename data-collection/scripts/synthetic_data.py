@@ -0,0 +1,107 @@
+import bisect
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+from scripts.benchmark_parser import BRAWLERS, random_tag
+
+# Maps per mode, so battles group into a realistic number of (mode, map) pairs
+MAPS = {
+    "gemGrab": ["Hard Rock Mine", "Crystal Arcade", "Undermine"],
+    "brawlBall": ["Backyard Bowl", "Center Stage", "Pinball Dreams"],
+    "heist": ["Safe Zone", "Hot Potato"],
+    "bounty": ["Shooting Star", "Hideout"],
+    "knockout": ["Belle's Rock", "Goldarm Gulch"],
+    "hotZone": ["Dueling Beetles", "Ring of Fire"],
+    "soloShowdown": ["Skull Creek"]
+}
+
+class PlayerGraph:
+
+    def __init__(self, players: int = 20_000, community_size: int = 50, battles_per_player: float = 40, history_hours: float = 12,
+                 duration_hours: float = 1, seed: int = 0, start: datetime | None = None):
+        # Players belong to communities (clubs, friend groups) and mostly battle within them, so the same battles
+        # show up in several players' battlelogs the way they do on the real API. Battles span the history window
+        # before start and the test duration after it, and are only served once their time has passed
+        rng = random.Random(seed)
+        self.start = start or datetime.now(timezone.utc)
+        self.tags = [random_tag(rng) for _ in range(players)]
+        self.index = {tag: i for i, tag in enumerate(self.tags)}
+        # Heavy-tailed activity (stored cumulatively for weighted picks) and trophies, so a few players battle
+        # constantly while most rarely do
+        self.activity = list(itertools.accumulate(rng.paretovariate(1.5) for _ in range(players)))
+        self.trophies = [min(1250, int(rng.lognormvariate(6.3, 0.35))) for _ in range(players)]
+        self.communities = [list(range(i, min(i + community_size, players))) for i in range(0, players, community_size)]
+        self.battles = []
+        # Per player, their battles' times (sorted) and indices into self.battles
+        self.player_times = [[] for _ in range(players)]
+        self.player_battles = [[] for _ in range(players)]
+
+        window = timedelta(hours=history_hours + duration_hours).total_seconds()
+        battles = []
+        for _ in range(int(players * battles_per_player / 6)):
+            # Activity-weighted host, with their teammates and opponents around them
+            host = min(bisect.bisect_left(self.activity, rng.uniform(0, self.activity[-1])), players - 1)
+            community = self.communities[host // community_size]
+            others = set()
+            while len(others) < 5:
+                # Mostly community members, sometimes matchmaking with strangers
+                other = rng.choice(community) if rng.random() < 0.7 else rng.randrange(players)
+                if other != host:
+                    others.add(other)
+            participants = [host, *others]
+            rng.shuffle(participants)
+            offset = rng.uniform(0, window)
+            battles.append((offset, participants))
+
+        battles.sort()
+        for offset, participants in battles:
+            self.add_battle(rng, self.start - timedelta(hours=history_hours) + timedelta(seconds=offset), participants)
+
+    def add_battle(self, rng: random.Random, battle_time: datetime, participants: list[int]):
+        mode = rng.choice(list(MAPS))
+        game_type = "soloRanked" if rng.random() < 0.2 else "ranked"
+        teams = [[{
+            "tag": self.tags[player],
+            "name": "player",
+            "brawler": {
+                "id": 16000000,
+                "name": rng.choice(BRAWLERS),
+                "power": rng.randint(7, 11),
+                # Power League battles report the player's rank instead of trophies
+                "trophies": rng.randint(1, 22) if game_type == "soloRanked" else max(0, self.trophies[player] + rng.randint(-100, 100))
+            }
+        } for player in team] for team in (participants[:3], participants[3:])]
+        timestamp = battle_time.timestamp()
+        self.battles.append({
+            "battleTime": battle_time.strftime("%Y%m%dT%H%M%S.000Z"),
+            "event": {"id": 15000000, "mode": mode, "map": rng.choice(MAPS[mode])},
+            "battle": {
+                "mode": mode,
+                "type": game_type,
+                # From the first team's perspective, flipped when served to a player of the second team
+                "result": rng.choice(["victory", "victory", "defeat", "defeat", "draw"]),
+                "duration": rng.randint(60, 180),
+                "teams": teams
+            }
+        })
+        for player in participants:
+            self.player_times[player].append(timestamp)
+            self.player_battles[player].append(len(self.battles) - 1)
+
+    def top_players(self, count: int = 200) -> list[dict]:
+        ranked = sorted(range(len(self.tags)), key=lambda player: -self.trophies[player])[:count]
+        return [{"tag": self.tags[player], "name": "player", "trophies": self.trophies[player] * 60, "rank": i + 1} for i, player in enumerate(ranked)]
+
+    def battlelog(self, tag: str, now: datetime, size: int = 25) -> list[dict] | None:
+        # The player's latest battles up to now, newest first, with the result from their own team's perspective
+        if (player := self.index.get(tag)) is None:
+            return None
+        end = bisect.bisect_right(self.player_times[player], now.timestamp())
+        items = []
+        for battle in reversed(self.player_battles[player][max(0, end - size):end]):
+            entry = self.battles[battle]
+            if any(member["tag"] == tag for member in entry["battle"]["teams"][1]):
+                result = {"victory": "defeat", "defeat": "victory"}.get(entry["battle"]["result"], "draw")
+                entry = {**entry, "battle": {**entry["battle"], "result": result}}
+            items.append(entry)
+        return items
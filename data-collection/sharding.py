@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+import zlib
+from collections import defaultdict
+from typing import Callable, Coroutine, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Per-shard counters published to the coordinator, one slot each in shared memory
+COUNTERS = ["players", "battles", "frontier", "sent", "received"]
+
+def shard_of(player_id: str, shards: int) -> int:
+    # Stable across processes and restarts, unlike hash() on strings
+    return zlib.crc32(player_id.encode()) % shards
+
+class ShardProgress:
+
+    def __init__(self, counters):
+        # counters is a multiprocessing Array of shards * len(COUNTERS) integers, each shard only writes its own row
+        self.counters = counters
+
+    @classmethod
+    def create(cls, context, shards: int) -> 'ShardProgress':
+        return cls(context.Array('q', shards * len(COUNTERS), lock=False))
+
+    def set(self, shard: int, **values):
+        for name, value in values.items():
+            self.counters[shard * len(COUNTERS) + COUNTERS.index(name)] = value
+
+    def totals(self) -> dict:
+        shards = len(self.counters) // len(COUNTERS)
+        return {name: sum(self.counters[shard * len(COUNTERS) + i] for shard in range(shards)) for i, name in enumerate(COUNTERS)}
+
+class ShardRouter:
+
+    def __init__(self, shard: int, inboxes: list):
+        # inboxes[i] is shard i's multiprocessing queue, players belonging to other shards are handed off in batches
+        self.shard = shard
+        self.inboxes = inboxes
+        self.sent = 0
+        self.received = 0
+
+    def route(self, players: Iterable[tuple[str, float]]) -> list[tuple[str, float]]:
+        # Returns this shard's players and sends every other player to the shard that owns it
+        local, remote = [], defaultdict(list)
+        for player_id, priority in players:
+            shard = shard_of(player_id, len(self.inboxes))
+            if shard == self.shard:
+                local.append((player_id, priority))
+            else:
+                remote[shard].append((player_id, priority))
+        for shard, batch in remote.items():
+            self.inboxes[shard].put(batch)
+            self.sent += len(batch)
+        return local
+
+    async def receive(self, add: Callable[[str, float], bool]):
+        # Feeds handed-off players into this shard's frontier, waiting on the queue in a thread so the loop stays free
+        loop = asyncio.get_running_loop()
+        inbox = self.inboxes[self.shard]
+        while True:
+            try:
+                batch = await loop.run_in_executor(None, inbox.get, True, 1)
+            except queue.Empty:
+                continue
+            for player_id, priority in batch:
+                add(player_id, priority)
+            self.received += len(batch)
+
+def run_shard(crawl: Coroutine):
+    # Runs a shard's crawl until the coordinator asks it to stop. A terminal's Ctrl-C reaches the whole process group,
+    # so shards ignore SIGINT and only the coordinator handles it. The coordinator's SIGTERM cancels the crawl once,
+    # further ones are ignored, so its cleanup (final flush and checkpoint) is never interrupted
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    async def run():
+        task, loop = asyncio.current_task(), asyncio.get_running_loop()
+        def stop():
+            loop.add_signal_handler(signal.SIGTERM, lambda: None)
+            task.cancel()
+        loop.add_signal_handler(signal.SIGTERM, stop)
+        try:
+            await crawl
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+def run_coordinator(target: Callable, shards: int, report_interval: float = 30, grace_period: float = 120):
+    # Starts one crawler process per shard and logs their combined progress until one of them exits
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue() for _ in range(shards)]
+    progress = ShardProgress.create(context, shards)
+
+    processes = [context.Process(target=target, args=(shard, shards, inboxes, progress.counters), name=f"crawler-{shard}") for shard in range(shards)]
+    for process in processes:
+        process.start()
+
+    started, last = time.monotonic(), progress.totals()
+    try:
+        while all(process.is_alive() for process in processes):
+            time.sleep(report_interval)
+            totals = progress.totals()
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"{shards} shards: {totals['players']:,} players ({(totals['players'] - last['players']) / report_interval:,.1f}/s), "
+                f"{totals['battles']:,} battles ({(totals['battles'] - last['battles']) / report_interval:,.1f}/s), "
+                f"frontier {totals['frontier']:,}, handoffs {totals['sent']:,} sent / {totals['received']:,} received, {elapsed / 60:,.0f} min"
+            )
+            last = totals
+
+        for process in processes:
+            if not process.is_alive():
+                logger.error(f"{process.name} exited with code {process.exitcode}, stopping all shards")
+    finally:
+        # SIGTERM cancels each shard's crawl once, so its buffered battles are flushed before it exits. Shards still
+        # running after the grace period are killed
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + grace_period
+        for process in processes:
+            process.join(timeout=max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error(f"{process.name} didn't stop within {grace_period:.0f} seconds, killing it")
+                process.kill()
+                process.join()
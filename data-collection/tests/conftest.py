@@ -0,0 +1,4 @@
+import os
+
+# brawl_stars_api reads its token at import, tests never reach the API
+os.environ.setdefault("BRAWL_STARS_TOKEN", "test")
@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+from battle_index import BloomFilter, DayShard, SeenBattleIndex, battle_key
+
+BATTLE_ID = "20250116T051233.000Z#2PP"
+
+def test_battle_key_is_stable_signed_64_bit():
+    key = battle_key(BATTLE_ID)
+    assert key == battle_key(BATTLE_ID)
+    assert -2 ** 63 <= key < 2 ** 63
+    assert key != battle_key(BATTLE_ID + "X")
+
+def test_compaction_merges_into_sorted_array():
+    shard = DayShard(compact_threshold=3)
+    keys = [50, -7, 12, 3, 99, -100, 0]
+    for key in keys:
+        shard.add(key)
+    shard.compact()
+    assert list(shard.compacted) == sorted(keys)
+    assert not shard.recent
+    assert len(shard) == len(keys)
+    assert all(key in shard for key in keys)
+    assert 1 not in shard
+
+def test_index_add_contains_and_len():
+    index = SeenBattleIndex(compact_threshold=2)
+    ids = [f"2025011{day}T000000.000Z#{i}" for day in range(6, 9) for i in range(5)]
+    index.update(ids)
+    for battle_id in ids:
+        index.add(battle_id)
+    assert len(index) == len(ids)
+    assert all(battle_id in index for battle_id in ids)
+    assert "20250116T000000.000Z#NEW" not in index
+    assert index.has_key("20250116", battle_key(ids[0]))
+
+def test_evict_before_drops_older_days():
+    index = SeenBattleIndex()
+    index.update(["20250115T000000.000Z#A", "20250116T000000.000Z#B", "20250117T000000.000Z#C"])
+    assert index.evict_before(datetime(2025, 1, 16, tzinfo=timezone.utc)) == 1
+    assert "20250115T000000.000Z#A" not in index
+    assert "20250116T000000.000Z#B" in index
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    keys = [battle_key(f"20250116T000000.000Z#{i}") for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+def test_index_with_bloom_filter():
+    index = SeenBattleIndex(compact_threshold=10, bloom_capacity=100)
+    index.update([BATTLE_ID])
+    assert BATTLE_ID in index
+    assert "20250116T051233.000Z#OTHER" not in index
@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+from battle_index import SeenBattleIndex, battle_key
+from battle_parser import BattleParser, crawl_priority, parse_battle_time
+
+CUTOFF = datetime(2025, 1, 16, tzinfo=timezone.utc)
+
+def player(tag, trophies=700, name='COLT', power=11):
+    return {'tag': tag, 'name': tag, 'brawler': {'id': 1, 'name': name, 'power': power, 'trophies': trophies}}
+
+def entry(team_0, team_1, result='victory', battle_time='20250116T051233.000Z', mode='gemGrab', game_type='ranked', game_map='Hard Rock Mine'):
+    return {
+        'battleTime': battle_time,
+        'event': {'id': 1, 'mode': mode, 'map': game_map},
+        'battle': {'mode': mode, 'type': game_type, 'result': result, 'teams': [[player(tag) for tag in team_0], [player(tag) for tag in team_1]]}
+    }
+
+def parse(battlelog, player_id='#A', parser=None, seen=None):
+    return (parser or BattleParser(CUTOFF)).parse(player_id, battlelog, seen if seen is not None else SeenBattleIndex())
+
+def test_parse_battle_time():
+    assert parse_battle_time('20250116T051233.000Z') == datetime(2025, 1, 16, 5, 12, 33, tzinfo=timezone.utc)
+
+def test_crawl_priority_scales_power_league_ranks():
+    assert crawl_priority('ranked', 700) == 700
+    assert crawl_priority('soloRanked', 15) == 750
+
+def test_parses_battle_participants_and_players():
+    battles, participants, players = parse([entry(['#A', '#B', '#C'], ['#D', '#E', '#F'])])
+    assert len(battles) == 1
+    battle = battles[0]
+    assert battle.battle_id == battle_key('20250116T051233.000Z#A')
+    assert (battle.game_mode, battle.game_map, battle.game_type, battle.result) == ('gemGrab', 'Hard Rock Mine', 'ranked', 1)
+    assert [(p.player_id, p.side) for p in participants] == [('#A', False), ('#B', False), ('#C', False), ('#D', True), ('#E', True), ('#F', True)]
+    assert players == [(tag, 700) for tag in ['#A', '#B', '#C', '#D', '#E', '#F']]
+
+def test_result_flips_when_player_is_on_the_second_team():
+    battles, participants, _ = parse([entry(['#A', '#B'], ['#C', '#D'], 'victory')], player_id='#C')
+    assert battles[0].result == -1
+    assert [p.player_id for p in participants if not p.side] == ['#A', '#B']
+
+def test_sides_swap_when_lowest_tag_is_on_the_second_team():
+    # #C's team won, but the other team holds the lowest tag #A, so it becomes side 0 and lost
+    battles, participants, _ = parse([entry(['#C', '#D'], ['#A', '#B'], 'victory')], player_id='#C')
+    assert battles[0].result == -1
+    assert battles[0].battle_id == battle_key('20250116T051233.000Z#A')
+    assert [p.player_id for p in participants if not p.side] == ['#A', '#B']
+
+def test_both_flips_cancel_out():
+    # #A reports a defeat from the second team, which holds the lowest tag: side 0 lost
+    battles, _, _ = parse([entry(['#C', '#D'], ['#A', '#B'], 'defeat')], player_id='#A')
+    assert battles[0].result == -1
+
+def test_same_battle_from_both_sides_is_one_battle():
+    seen = SeenBattleIndex()
+    first = parse([entry(['#A', '#B'], ['#C', '#D'], 'victory')], player_id='#A', seen=seen)[0]
+    parser = BattleParser(CUTOFF)
+    second = parse([entry(['#C', '#D'], ['#A', '#B'], 'defeat')], player_id='#C', parser=parser, seen=seen)[0]
+    assert len(first) == 1 and second == []
+    assert (parser.lookups, parser.duplicates) == (1, 1)
+
+def test_filters_modes_types_cutoff_and_incomplete_battles():
+    battlelog = [
+        entry(['#A'], ['#B'], mode='soloShowdown'),
+        entry(['#A'], ['#B'], game_type='friendly'),
+        entry(['#A'], ['#B'], battle_time='20250115T235959.000Z'),
+        entry(['#A'], ['#B'], result=None),
+    ]
+    battlelog.append(entry(['#A'], ['#B']))
+    battlelog[-1]['battle']['teams'].append([player('#C')])
+    assert parse(battlelog) == ([], [], [])
+
+def test_draws_are_kept():
+    battles, _, _ = parse([entry(['#A'], ['#B'], 'draw')])
+    assert battles[0].result == 0
+
+def test_minimum_rank_needs_one_player_above_it():
+    parser = BattleParser(CUTOFF, minimum_trophies=800)
+    low = entry(['#A'], ['#B'])
+    high = entry(['#A'], ['#B'], battle_time='20250116T060000.000Z')
+    high['battle']['teams'][1][0]['brawler']['trophies'] = 900
+    battles, _, _ = parse([low, high], parser=parser)
+    assert [battle.battle_time.hour for battle in battles] == [6]
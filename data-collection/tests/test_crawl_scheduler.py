@@ -0,0 +1,127 @@
+import asyncio
+import time
+from crawl_scheduler import CrawlScheduler
+
+def run(coroutine, timeout=5):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout))
+
+def test_revisit_delay_is_clamped():
+    scheduler = CrawlScheduler(min_revisit=600, max_revisit=86_400, revisit_battles=20)
+    assert scheduler.revisit_delay('#UNKNOWN') == 86_400
+    scheduler.battle_rate['#BUSY'] = 1.0
+    scheduler.battle_rate['#IDLE'] = 1e-9
+    scheduler.battle_rate['#STEADY'] = 20 / 3600
+    assert scheduler.revisit_delay('#BUSY') == 600
+    assert scheduler.revisit_delay('#IDLE') == 86_400
+    assert abs(scheduler.revisit_delay('#STEADY') - 3600) < 1e-6
+
+def test_record_battles_estimates_and_smooths_the_rate():
+    scheduler = CrawlScheduler()
+    now = time.time()
+    scheduler.record_battles('#A', [])
+    assert '#A' not in scheduler.battle_rate
+    scheduler.record_battles('#A', [now - 1000 + i * 40 for i in range(25)])
+    assert abs(scheduler.battle_rate['#A'] - 25 / 1000) < 1e-3
+    assert scheduler.last_battle['#A'] == now - 1000 + 24 * 40
+    scheduler.record_battles('#A', [now - 10_000])
+    assert abs(scheduler.battle_rate['#A'] - (25 / 1000 + 1 / 10_000) / 2) < 1e-3
+    assert '#A' in scheduler.dirty
+
+def test_add_skips_queued_recent_and_overflowing_players():
+    async def check():
+        scheduler = CrawlScheduler(max_frontier=2)
+        assert scheduler.add('#A', 700)
+        assert not scheduler.add('#A', 900)
+        scheduler.restore('#B', time.time(), None, None, 800)
+        assert not scheduler.add('#B', 800)
+        assert scheduler.add('#C')
+        assert not scheduler.add('#D')
+        assert dict(scheduler.frontier()) == {'#A': 700, '#C': 0}
+    run(check())
+
+def test_run_processes_seeds_by_priority_and_discoveries():
+    async def check():
+        scheduler = CrawlScheduler(workers=1)
+        crawled = []
+        async def handler(player_id):
+            crawled.append(player_id)
+            return [('#D', 100)] if player_id == '#A' else []
+        await scheduler.run(handler, [('#B', 100), ('#A', 900), ('#C', 500)])
+        return scheduler, crawled
+    scheduler, crawled = run(check())
+    assert crawled == ['#A', '#C', '#B', '#D']
+    assert set(scheduler.last_crawled) == {'#A', '#B', '#C', '#D'}
+    assert scheduler.priority['#A'] == 900
+    assert not scheduler.queued and len(scheduler.revisits) == 4
+
+def test_handler_errors_dont_stop_the_crawl():
+    async def check():
+        scheduler = CrawlScheduler(workers=2)
+        async def handler(player_id):
+            if player_id == '#A':
+                raise RuntimeError("boom")
+            return []
+        await scheduler.run(handler, [('#A', 1), ('#B', 1)])
+        return scheduler
+    assert set(run(check()).last_crawled) == {'#A', '#B'}
+
+def test_leftover_carries_over_to_the_next_loop():
+    async def check():
+        scheduler = CrawlScheduler(workers=1, players_per_loop=2)
+        async def handler(player_id):
+            await asyncio.sleep(0.01)
+            return []
+        await scheduler.run(handler, [(f'#{i}', 10 - i) for i in range(6)])
+        first = set(scheduler.last_crawled)
+        leftover = dict(scheduler.leftover)
+        await scheduler.run(handler, [])
+        return first, leftover, scheduler
+    first, leftover, scheduler = run(check())
+    # The in-flight player is finished after the limit, the rest carry over with their priority
+    assert {'#0', '#1'} <= first and len(first) < 6
+    assert leftover == {f'#{i}': 10 - i for i in range(6) if f'#{i}' not in first}
+    assert len(scheduler.last_crawled) > len(first) and not scheduler.queued
+
+def test_due_revisits_are_released():
+    async def check():
+        scheduler = CrawlScheduler(min_revisit=600)
+        scheduler.restore('#A', time.time() - 100_000, None, None, 700)
+        scheduler.restore('#B', time.time(), None, None, 700)
+        scheduler.release_due()
+        return scheduler
+    scheduler = run(check())
+    assert dict(scheduler.frontier()) == {'#A': 700}
+    assert [player_id for _, player_id in scheduler.revisits] == ['#B']
+
+def test_budget_below_one_player_per_second_still_crawls():
+    async def check():
+        scheduler = CrawlScheduler(workers=2, request_budget=0.5)
+        async def handler(player_id):
+            return []
+        await scheduler.run(handler, [('#A', 1)])
+        return scheduler
+    scheduler = run(check(), timeout=3)
+    assert scheduler.budget.capacity == 1
+    assert '#A' in scheduler.last_crawled
+
+def test_rescheduling_keeps_one_live_revisit_per_player():
+    scheduler = CrawlScheduler(min_revisit=600)
+    for crawl in range(1000):
+        for player_id in ('#A', '#B', '#C'):
+            scheduler.last_crawled[player_id] = time.time() - 100_000 + crawl
+            scheduler.schedule_revisit(player_id)
+    assert len(scheduler.planned) == 3
+    assert len(scheduler.revisits) <= 2 * len(scheduler.planned)
+
+def test_stale_revisits_are_skipped():
+    async def check():
+        scheduler = CrawlScheduler(min_revisit=600)
+        scheduler.restore('#A', time.time() - 100_000, None, None, 700)
+        # Crawled again since, so the planned revisit moved into the future
+        scheduler.last_crawled['#A'] = time.time()
+        scheduler.schedule_revisit('#A')
+        scheduler.release_due()
+        return scheduler
+    scheduler = run(check())
+    assert scheduler.frontier() == []
+    assert list(scheduler.planned) == ['#A']
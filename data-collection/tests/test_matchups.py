@@ -0,0 +1,74 @@
+import numpy as np
+from scripts.matchups import COUNTER_GAMES, COUNTER_WINS, KINDS, SYNERGY_GAMES, SYNERGY_WINS, MatchupAccumulator, add_matchup_files, dense, matchup_payload, sparse
+from scripts.data_export import DataExporter
+
+FAMILIES = {'ranked': [700, 800, 900, 1000]}
+
+def row(side_0, side_1, result, level=1, map_id=1, game_type='ranked'):
+    return {'game_type': game_type, 'mode_id': 1, 'map_id': map_id, 'level': level, 'result': result, 'side_0': side_0, 'side_1': side_1}
+
+def test_counts_counters_and_synergies_of_decisive_battles():
+    accumulator = MatchupAccumulator(8)
+    accumulator.add_rows([row([1, 2, 3], [4, 5, 6], 1), row([4, 5, 6], [1, 2, 3], 1), row([1, 2, 3], [4, 5, 6], 0)])
+    counts = accumulator.counts[accumulator.slots[('ranked', 1, 1, 1)]]
+    assert counts[COUNTER_GAMES, 1, 4] == 2 and counts[COUNTER_WINS, 1, 4] == 1
+    assert counts[COUNTER_GAMES, 4, 1] == 2 and counts[COUNTER_WINS, 4, 1] == 1
+    assert counts[SYNERGY_GAMES, 1, 2] == 2 and counts[SYNERGY_WINS, 1, 2] == 1
+    assert counts[SYNERGY_GAMES, 4, 5] == 2 and counts[SYNERGY_WINS, 4, 5] == 1
+    assert counts[SYNERGY_GAMES, 1, 1] == 0
+    assert counts[COUNTER_GAMES].sum() == 2 * 2 * 9
+
+def test_slots_are_allocated_separately_and_skip_invalid_rows():
+    accumulator = MatchupAccumulator(8)
+    accumulator.add_rows([row([1], [2], 1, map_id=map_id) for map_id in range(100)] + [row([1, 2], [3], 1), row([1], [2], 1, level=None)])
+    assert len(accumulator.counts) == len(accumulator.slots) == 100
+    assert all(counts[COUNTER_GAMES, 1, 2] == 1 and counts.sum() == 3 for counts in accumulator.counts)
+
+def test_cumulative_sums_higher_buckets():
+    accumulator = MatchupAccumulator(4)
+    accumulator.add_rows([row([1], [2], 1, level=1), row([1], [2], -1, level=3)])
+    buckets, counts = dict(accumulator.cumulative(FAMILIES))[(1, 1)]['ranked']
+    assert buckets == FAMILIES['ranked']
+    assert counts[:, COUNTER_GAMES, 1, 2].tolist() == [2, 1, 1, 0]
+    assert counts[:, COUNTER_WINS, 2, 1].tolist() == [1, 1, 1, 0]
+
+def test_sparse_round_trip():
+    matrix = np.array([[0, 3], [1, 0]], dtype=np.uint64)
+    assert sparse(matrix) == [[0, 1, 3], [1, 0, 1]]
+    assert dense(sparse(matrix), 2).tolist() == matrix.tolist()
+    assert dense([], 2).tolist() == [[0, 0], [0, 0]]
+
+def test_payload_keeps_present_brawlers_and_non_empty_buckets():
+    accumulator = MatchupAccumulator(6)
+    accumulator.add_rows([row([2], [5], 1)])
+    views = {'trophies': dict(accumulator.cumulative(FAMILIES))[(1, 1)]['ranked']}
+    payload = matchup_payload(views, {2: 'COLT', 5: 'SHELLY'})
+    assert payload['brawlers'] == ['COLT', 'SHELLY']
+    assert list(payload['trophies']) == ['700']
+    bucket = payload['trophies']['700']
+    assert set(bucket) == set(KINDS)
+    assert bucket['counter_games'] == [[0, 1, 1], [1, 0, 1]]
+    assert bucket['counter_wins'] == [[0, 1, 1]]
+    assert bucket['synergy_games'] == []
+
+def test_add_matchup_files(tmp_path):
+    accumulator = MatchupAccumulator(6)
+    accumulator.add_rows([row([2], [5], 1)])
+    exporter = DataExporter(str(tmp_path / 'data'))
+    dictionaries = {'game_mode': {1: 'gemGrab'}, 'game_map': {1: 'Hard Rock Mine'}, 'brawler': {2: 'COLT', 5: 'SHELLY'}}
+    [(key, entry, payload)] = add_matchup_files(exporter, accumulator, FAMILIES, dictionaries)
+    assert key == ('gemgrab', 'Hard Rock Mine')
+    assert entry['path'] == 'gemgrab/Hard Rock Mine/matchups.json'
+    assert 'gemgrab/Hard Rock Mine/matchups.json' in exporter.files
+    assert payload['brawlers'] == ['COLT', 'SHELLY']
+
+def test_cumulative_releases_each_map_before_the_next():
+    accumulator = MatchupAccumulator(4)
+    accumulator.add_rows([row([1], [2], 1, map_id=map_id, level=level) for map_id in (1, 2) for level in (1, 2)])
+    released = []
+    for (mode_id, map_id), totals in accumulator.cumulative({**FAMILIES, 'soloRanked': [10]}):
+        released.append(sum(counts is None for counts in accumulator.counts))
+        assert list(totals) == ['ranked']
+    # Each map's two slots are released when its totals are built, not all at once up front
+    assert released == [2, 4]
+    assert accumulator.counts == [] and accumulator.slots == {}
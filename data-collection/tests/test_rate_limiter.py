@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from rate_limiter import RateLimiter, TokenBucket, backoff_delay, parse_retry_after
+
+def test_sub_one_capacity_still_hands_out_tokens():
+    bucket = TokenBucket("token", rate=0.5, capacity=0.5, min_rate=0.5)
+    assert bucket.capacity == 1
+    asyncio.run(asyncio.wait_for(bucket.acquire(), 1))
+
+def test_rate_limiter_default_capacity_is_at_least_one_token():
+    limiter = RateLimiter(["token"], rate=0.25)
+    assert limiter.buckets[0].capacity == 1
+    asyncio.run(asyncio.wait_for(limiter.acquire(), 1))
+
+def test_throttle_halves_rate_down_to_minimum_and_blocks():
+    bucket = TokenBucket("token", rate=20, capacity=20, min_rate=4)
+    bucket.throttle(5)
+    assert bucket.rate == 10
+    assert bucket.tokens <= 0
+    assert bucket.wait_time() > 4
+    for _ in range(5):
+        bucket.throttle(None)
+    assert bucket.rate == 4
+
+def test_recover_increases_rate_up_to_maximum():
+    bucket = TokenBucket("token", rate=20, capacity=20, min_rate=1)
+    bucket.throttle(None)
+    bucket.recover()
+    assert bucket.rate == pytest.approx(10.2)
+    for _ in range(100):
+        bucket.recover()
+    assert bucket.rate == 20
+
+def test_rate_limiter_requires_a_token():
+    with pytest.raises(ValueError):
+        RateLimiter([], rate=1)
+
+@pytest.mark.parametrize("value, expected", [(None, None), ("", None), ("3", 3.0), ("-1", 0), ("garbage", None)])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+def test_parse_retry_after_past_http_date():
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+def test_backoff_delay_is_capped():
+    for attempt in range(20):
+        assert 0 <= backoff_delay(attempt, base=0.5, cap=30) <= min(30, 0.5 * 2 ** attempt)
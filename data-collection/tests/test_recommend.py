@@ -0,0 +1,78 @@
+import json
+import numpy as np
+import pytest
+from scripts.data_export import DataExporter
+from scripts.recommend import DraftIndex, DraftTable, add_draft_file, draft_tables
+
+BRAWLERS = ['COLT', 'POCO', 'SHELLY']
+
+# Everyone is even against POCO, COLT beat SHELLY 90 of 100 times
+COUNTER_GAMES = [[0, 1000, 100], [1000, 0, 1000], [100, 1000, 0]]
+COUNTER_WINS = [[0, 500, 90], [500, 0, 500], [10, 500, 0]]
+
+def table(counter_games=None, counter_wins=None, synergy_games=None, synergy_wins=None, prior_games=50):
+    zeros = np.zeros((3, 3))
+    return DraftTable(BRAWLERS, *(zeros if m is None else np.array(m, dtype=np.float64) for m in (counter_games, counter_wins, synergy_games, synergy_wins)), prior_games=prior_games)
+
+def test_no_games_scores_zero():
+    draft = table()
+    assert np.allclose(draft.solo, 0) and np.allclose(draft.counter, 0) and np.allclose(draft.synergy, 0)
+
+def test_solo_counter_and_synergy_signs():
+    # POCO and SHELLY won 90 of 100 games together
+    counter_games = COUNTER_GAMES
+    counter_wins = COUNTER_WINS
+    synergy_games = [[0, 0, 0], [0, 0, 100], [0, 100, 0]]
+    synergy_wins = [[0, 0, 0], [0, 0, 90], [0, 90, 0]]
+    draft = table(counter_games, counter_wins, synergy_games, synergy_wins)
+    assert draft.solo[0] > 0 > draft.solo[2]
+    assert draft.counter[0, 2] > 0 > draft.counter[2, 0]
+    assert draft.synergy[1, 2] > 0
+    assert np.all(np.diag(draft.synergy) == 0)
+
+def test_recommend_excludes_picks_and_sums_components():
+    counter_games = COUNTER_GAMES
+    counter_wins = COUNTER_WINS
+    draft = table(counter_games, counter_wins)
+    picks = draft.recommend(allies=['POCO'], enemies=['SHELLY', 'UNKNOWN'])
+    assert [pick['brawler'] for pick in picks] == ['COLT']
+    pick = picks[0]
+    assert pick['score'] == pytest.approx(pick['solo'] + pick['synergy'] + pick['counter'], abs=1e-3)
+    assert pick['counter'] > 0
+    assert [pick['brawler'] for pick in draft.recommend(limit=1)] == ['COLT']
+
+def test_lookup_is_flattened():
+    lookup = table().lookup()
+    assert lookup['brawlers'] == BRAWLERS
+    assert len(lookup['solo']) == 3 and len(lookup['synergy']) == len(lookup['counter']) == 9
+
+def payload():
+    return {'brawlers': ['COLT', 'SHELLY'], 'trophies': {'700': {
+        'counter_games': [[0, 1, 100], [1, 0, 100]],
+        'counter_wins': [[0, 1, 80], [1, 0, 20]],
+        'synergy_games': [],
+        'synergy_wins': []
+    }}}
+
+def test_draft_tables_from_sparse_payload():
+    tables = draft_tables(payload())
+    assert list(tables) == [('trophies', 700)]
+    assert tables[('trophies', 700)].solo[0] > 0 > tables[('trophies', 700)].solo[1]
+
+def test_draft_index_load(tmp_path):
+    (tmp_path / 'gemgrab').mkdir()
+    (tmp_path / 'gemgrab' / 'matchups.json').write_text(json.dumps(payload()))
+    (tmp_path / 'manifest.json').write_text(json.dumps({'modes': {'gemgrab': {
+        'Hard Rock Mine': {'matchups': {'path': 'gemgrab/matchups.json'}},
+        'Crystal Arcade': {}
+    }}}))
+    index = DraftIndex.load(str(tmp_path))
+    assert index.recommend('gemGrab', 'Hard Rock Mine', 'trophies', 700)[0]['brawler'] == 'COLT'
+    with pytest.raises(KeyError):
+        index.recommend('gemgrab', 'Crystal Arcade', 'trophies', 700)
+
+def test_add_draft_file(tmp_path):
+    exporter = DataExporter(str(tmp_path / 'data'))
+    entry = add_draft_file(exporter, 'gemgrab', 'Hard Rock Mine', payload())
+    assert entry['path'] == 'gemgrab/Hard Rock Mine/draft.json'
+    assert 'gemgrab/Hard Rock Mine/draft.json' in exporter.files
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from scripts.scoring import TEAM_MIN_CAP, TEAM_MIN_FLOOR, adaptive_min_games, bayesian_win_rate, group_ids, group_totals, score_records, scores, wilson_lower_bound
+
+def record(game_map, games, victories, bucket=700, game_mode='gemGrab'):
+    return {'game_mode': game_mode, 'game_map': game_map, 'bucket': bucket, 'games_played': games, 'victories': victories}
+
+def test_group_ids_are_dense_in_first_seen_order():
+    assert group_ids([('a', 1), ('b', 1), ('a', 1), ('a', 2)]).tolist() == [0, 1, 0, 2]
+
+def test_wilson_lower_bound():
+    bounds = wilson_lower_bound(np.array([50.0, 500.0, 0.0]), np.array([100.0, 1000.0, 0.0]))
+    assert 0.4 < bounds[0] < bounds[1] < 0.5
+    assert bounds[2] == 0
+
+def test_bayesian_win_rate_shrinks_towards_group_average():
+    victories, games = np.array([10.0, 40.0]), np.array([10.0, 90.0])
+    rates = bayesian_win_rate(victories, games, np.array([0, 0]), prior_games=100)
+    assert rates[0] == pytest.approx((10 + 0.5 * 100) / 110)
+    assert rates[1] == pytest.approx((40 + 0.5 * 100) / 190)
+
+def test_unknown_method_raises():
+    with pytest.raises(ValueError):
+        scores(np.array([1.0]), np.array([2.0]), np.array([0]), 'elo')
+
+def test_adaptive_min_games_is_clipped():
+    assert adaptive_min_games(np.array([0.0, 200_000.0, 1e9])).tolist() == [TEAM_MIN_FLOOR, 200, TEAM_MIN_CAP]
+
+def test_group_totals():
+    totals = group_totals([record('A', 10, 5), record('A', 20, 5), record('B', 7, 1), record('A', 3, 1, bucket=800)])
+    assert totals == {('gemGrab', 'A', 700): 30, ('gemGrab', 'B', 700): 7, ('gemGrab', 'A', 800): 3}
+
+def test_score_records_keeps_all_without_totals():
+    _, keep = score_records([record('A', 1, 1), record('A', 2, 1)])
+    assert keep.all()
+
+def test_score_records_uses_given_totals_in_games():
+    # 600,000 observations are 200,000 games, so teams need 200 games (600 observations), whatever was fetched
+    records = [record('A', 3 * 250, 3 * 150), record('A', 3 * 150, 3 * 100)]
+    team_scores, keep = score_records(records, observations_per_game=3, totals={('gemGrab', 'A', 700): 600_000})
+    assert keep.tolist() == [True, False]
+    assert team_scores[0] == pytest.approx(wilson_lower_bound(np.array([150.0]), np.array([250.0]))[0])
+
+def test_score_records_missing_total_falls_back_to_floor():
+    _, keep = score_records([record('A', 3 * TEAM_MIN_FLOOR, 0), record('A', 3, 0)], observations_per_game=3, totals={})
+    assert keep.tolist() == [True, False]
+
+def test_score_records_empty():
+    team_scores, keep = score_records([], totals={})
+    assert len(team_scores) == len(keep) == 0
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import queue
+import signal
+import subprocess
+import sys
+import time
+from brawl_stars_api import BrawlStarsAPI
+from main import shard_tokens
+from sharding import ShardProgress, ShardRouter, shard_of
+
+TAGS = [f"#{i:08X}" for i in range(2000)]
+
+def test_shard_of_is_stable_and_in_range():
+    shards = [shard_of(tag, 4) for tag in TAGS]
+    assert shards == [shard_of(tag, 4) for tag in TAGS]
+    assert set(shards) == {0, 1, 2, 3}
+    assert all(shard_of(tag, 1) == 0 for tag in TAGS)
+
+def test_shard_of_spreads_players_evenly():
+    counts = [0] * 4
+    for tag in TAGS:
+        counts[shard_of(tag, 4)] += 1
+    assert min(counts) > len(TAGS) / 4 * 0.8
+
+def test_router_keeps_own_players_and_hands_off_the_rest():
+    inboxes = [queue.Queue() for _ in range(3)]
+    router = ShardRouter(1, inboxes)
+    players = [(tag, 700) for tag in TAGS[:100]]
+    local = router.route(players)
+    assert local == [player for player in players if shard_of(player[0], 3) == 1]
+    handed_off = []
+    for shard in (0, 2):
+        while not inboxes[shard].empty():
+            batch = inboxes[shard].get()
+            assert all(shard_of(tag, 3) == shard for tag, _ in batch)
+            handed_off.extend(batch)
+    assert inboxes[1].empty()
+    assert router.sent == len(handed_off) == len(players) - len(local)
+
+def test_progress_totals():
+    progress = ShardProgress([0] * (2 * 5))
+    progress.set(0, players=3, battles=10)
+    progress.set(1, players=4, frontier=7)
+    assert progress.totals() == {'players': 7, 'battles': 10, 'frontier': 7, 'sent': 0, 'received': 0}
+
+def test_shard_tokens_splits_tokens_between_shards():
+    tokens = ['a', 'b', 'c', 'd', 'e']
+    assert [shard_tokens(shard, 2, tokens) for shard in range(2)] == [(['a', 'c', 'e'], None), (['b', 'd'], None)]
+
+def test_shard_tokens_shares_a_token_and_its_rate(monkeypatch):
+    monkeypatch.setenv('BRAWL_STARS_RATE_LIMIT', '2')
+    # Three shards on token a and two on token b
+    assert [shard_tokens(shard, 5, ['a', 'b']) for shard in range(5)] == [(['a'], 2 / 3), (['b'], 1.0), (['a'], 2 / 3), (['b'], 1.0), (['a'], 2 / 3)]
+
+def test_shared_token_below_one_request_per_second_still_acquires(monkeypatch):
+    monkeypatch.setenv('BRAWL_STARS_RATE_LIMIT', '2')
+    monkeypatch.delenv('BRAWL_STARS_BURST', raising=False)
+    api = BrawlStarsAPI(*shard_tokens(0, 3, ['a']))
+    assert all(bucket.capacity == 1 for bucket in api.rate_limiter.buckets)
+
+    async def acquire_twice():
+        await api.rate_limiter.acquire()
+        await api.rate_limiter.acquire()
+    asyncio.run(asyncio.wait_for(acquire_twice(), 3))
+
+COORDINATOR = '''
+import asyncio
+import sys
+sys.path.insert(0, {root!r})
+from sharding import run_coordinator, run_shard
+
+async def crawl(shard):
+    try:
+        open(f"{directory}/started-{{shard}}", "w").close()
+        await asyncio.sleep(3600)
+    finally:
+        # Stands in for the final flush and checkpoint, which a second interrupt would cut short
+        await asyncio.sleep(0.5)
+        open(f"{directory}/flushed-{{shard}}", "w").close()
+
+def target(shard, shards, inboxes, counters):
+    run_shard(crawl(shard))
+
+if __name__ == "__main__":
+    run_coordinator(target, 2, report_interval=0.1, grace_period=20)
+'''
+
+def test_ctrl_c_lets_every_shard_flush(tmp_path):
+    # Ctrl-C in a terminal sends SIGINT to the coordinator and every shard at once
+    script = tmp_path / 'coordinator.py'
+    script.write_text(COORDINATOR.format(root=os.getcwd(), directory=str(tmp_path)))
+    process = subprocess.Popen([sys.executable, str(script)], start_new_session=True, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while not all((tmp_path / f'started-{shard}').exists() for shard in range(2)):
+            assert time.monotonic() < deadline and process.poll() is None
+            time.sleep(0.05)
+        os.killpg(process.pid, signal.SIGINT)
+        process.wait(timeout=30)
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+    assert all((tmp_path / f'flushed-{shard}').exists() for shard in range(2))
@@ -1,6 +1,6 @@
 'use client';
 
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect } from 'react';
 import { use } from 'react';
 import Link from 'next/link';
 import Image from 'next/image';
@@ -9,12 +9,34 @@ interface BrawlerStats {
   brawler: string;
   games_played: number;
   win_rate: number;
+  score: number;
 }
 
 interface TeamComposition {
   team: string[];
   games_played: number;
   win_rate: number;
+  score: number;
+}
+
+// Bundles store every bucket of a map column by column, with brawlers as indexes into `brawlers`
+interface BucketColumns {
+  brawler?: number[];
+  team?: number[][];
+  games_played: number[];
+  win_rate: number[];
+  score: number[];
+}
+
+interface MapBundle {
+  brawlers: string[];
+  trophies?: Record<string, BucketColumns>;
+  ranked?: Record<string, BucketColumns>;
+  teams?: Record<string, BucketColumns>;
+}
+
+interface Manifest {
+  modes: Record<string, Record<string, { bundle: string; hash: string }>>;
 }
 
 interface MapPageProps {
@@ -40,101 +62,76 @@ export default function MapPage({ params }: MapPageProps) {
 
   const [isFilterOpen, setIsFilterOpen] = useState(false);
 
-  const fetchData = useCallback(async (level: number) => {
-    try {
-      let endpoint;
-      const subFolder = viewMode === 'trophies' || viewMode === 'teams' ? 'trophies' : 'ranked';
-      const decodedMapName = decodeURIComponent(mapName);
-      const encodedMapName = encodeURIComponent(decodedMapName);
-      const gameModeFolder = gameMode.toLowerCase();
-      
-      if (viewMode === 'ranked') {
-        endpoint = `/data/${gameModeFolder}/${encodedMapName}/ranked/brawler-${rank}-rank.json`;
-      } else if (viewMode === 'teams') {
-        endpoint = `/data/${gameModeFolder}/${encodedMapName}/${subFolder}/team-${level}-trophies.json`;
-      } else {
-        endpoint = `/data/${gameModeFolder}/${encodedMapName}/${subFolder}/brawler-${level}-trophies.json`;
-      }
-      
-      console.log('Attempting to fetch:', endpoint);
-      const response = await fetch(endpoint);
-      if (!response.ok) {
-        console.error('Response not OK:', response.status, response.statusText);
-        throw new Error(`Data not found: ${response.status}`);
-      }
-      const data = await response.json();
-      console.log('Data fetched successfully');
-      
-      if (viewMode === 'teams') {
-        setTeamStats(data);
-      } else {
-        setStats(data);
-      }
-    } catch (error) {
-      console.error('Error fetching data:', error, {
-        gameMode,
-        mapName,
-        viewMode,
-        level
-      });
-      if (viewMode === 'teams') {
-        setTeamStats([]);
-      } else {
-        setStats([]);
-      }
-    }
-  }, [gameMode, mapName, viewMode, rank]);
+  const [bundle, setBundle] = useState<MapBundle | null>(null);
 
   useEffect(() => {
-    const checkDataAvailability = async () => {
+    const loadBundle = async () => {
       try {
         const decodedMapName = decodeURIComponent(mapName);
-        const encodedMapName = encodeURIComponent(decodedMapName);
         const gameModeFolder = gameMode.toLowerCase();
 
-        console.log('Checking availability for:', {
-          gameMode: gameModeFolder,
-          mapName: encodedMapName
-        });
+        // The manifest is small and always revalidated, bundles are immutable per content hash
+        const manifestResponse = await fetch('/data/manifest.json', { cache: 'no-cache' });
+        if (!manifestResponse.ok) {
+          throw new Error(`Manifest not found: ${manifestResponse.status}`);
+        }
+        const manifest: Manifest = await manifestResponse.json();
+        const entry = manifest.modes[gameModeFolder]?.[decodedMapName];
+        if (!entry) {
+          throw new Error('Map not found in manifest');
+        }
 
-        const trophyResponse = await fetch(`/data/${gameModeFolder}/${encodedMapName}/trophies/brawler-700-trophies.json`);
-        const hasTrophy = trophyResponse.ok;
-        setHasTrophyData(hasTrophy);
-        console.log('Trophy data available:', hasTrophy);
+        const bundlePath = entry.bundle.split('/').map(encodeURIComponent).join('/');
+        const response = await fetch(`/data/${bundlePath}?v=${entry.hash}`);
+        if (!response.ok) {
+          throw new Error(`Data not found: ${response.status}`);
+        }
+        const data: MapBundle = await response.json();
+        setBundle(data);
 
-        const rankedResponse = await fetch(`/data/${gameModeFolder}/${encodedMapName}/ranked/brawler-10-rank.json`);
-        const hasRanked = rankedResponse.ok;
+        const hasTrophy = !!data.trophies;
+        const hasRanked = !!data.ranked;
+        setHasTrophyData(hasTrophy);
         setHasRankedData(hasRanked);
-        console.log('Ranked data available:', hasRanked);
-
-        if (!viewMode) {
-          if (hasTrophy) {
-            setViewMode('trophies');
-          } else if (hasRanked) {
-            setViewMode('ranked');
-          }
-        }
+
+        setViewMode(current => current ?? (hasTrophy ? 'trophies' : hasRanked ? 'ranked' : undefined));
       } catch (error) {
-        console.error('Error checking data availability:', error);
+        console.error('Error fetching data:', error, { gameMode, mapName });
+        setBundle(null);
+        setHasTrophyData(false);
+        setHasRankedData(false);
       }
     };
 
-    checkDataAvailability();
-  }, [gameMode, mapName, viewMode]);
+    loadBundle();
+  }, [gameMode, mapName]);
 
+  // Switching view, bucket or rank only reads from the bundle already in memory
   useEffect(() => {
-    if (!viewMode) return;
-
-    if (viewMode === 'ranked') {
-      fetchData(0);
+    const columns = !bundle || !viewMode ? undefined
+      : viewMode === 'ranked' ? bundle.ranked?.[rank]
+      : viewMode === 'teams' ? bundle.teams?.[trophyLevel]
+      : bundle.trophies?.[trophyLevel];
+
+    if (viewMode === 'teams') {
+      setTeamStats(columns ? columns.team!.map((team, i) => ({
+        team: team.map(brawler => bundle!.brawlers[brawler]),
+        games_played: columns.games_played[i],
+        win_rate: columns.win_rate[i],
+        score: columns.score[i]
+      })) : []);
     } else {
-      fetchData(700);
+      setStats(columns ? columns.brawler!.map((brawler, i) => ({
+        brawler: bundle!.brawlers[brawler],
+        games_played: columns.games_played[i],
+        win_rate: columns.win_rate[i],
+        score: columns.score[i]
+      })) : []);
     }
-  }, [viewMode, rank, gameMode, mapName, fetchData]);
+  }, [bundle, viewMode, rank, trophyLevel]);
 
   const handleTrophyLevelChange = (level: number) => {
     setTrophyLevel(level);
-    fetchData(level);
   };
 
   const getWinRateColor = (winRate: number) => {
@@ -203,10 +200,7 @@ export default function MapPage({ params }: MapPageProps) {
         ].map(({ label, value, icon }) => (
           <button
             key={value}
-            onClick={() => {
-              setRank(value);
-              fetchData(0);
-            }}
+            onClick={() => setRank(value)}
             className={`
               relative px-3 py-1 text-sm font-medium
               transition-all duration-200 ease-out flex items-center gap-1
@@ -345,7 +339,8 @@ export default function MapPage({ params }: MapPageProps) {
           selectedBrawlers.length === 0 || 
           selectedBrawlers.every(brawler => stat.team.includes(brawler))
         )
-        .sort((a, b) => b.win_rate - a.win_rate)
+        // Confidence-adjusted score, so small samples don't outrank well-established picks
+        .sort((a, b) => b.score - a.score)
         .map((comp, index) => (
           <div key={index} className="bg-white dark:bg-gray-800 rounded-lg shadow-md hover:shadow-lg transition-all duration-200 overflow-hidden">
             <div className="flex items-center p-1.5">
@@ -475,7 +470,7 @@ export default function MapPage({ params }: MapPageProps) {
             <div className="space-y-2 mb-8">
               {stats
                 .filter(stat => stat.games_played >= minGames)
-                .sort((a, b) => b.win_rate - a.win_rate)
+                .sort((a, b) => b.score - a.score)
                 .map((stat) => (
                   <div
                     key={stat.brawler}
@@ -527,7 +522,7 @@ export default function MapPage({ params }: MapPageProps) {
                 <div className="space-y-2">
                   {stats
                     .filter(stat => stat.games_played < minGames)
-                    .sort((a, b) => b.win_rate - a.win_rate)
+                    .sort((a, b) => b.score - a.score)
                     .map((stat) => (
                       <div
                         key={stat.brawler}